@@ -0,0 +1,26 @@
+"""
+Per-user cart versions.
+
+Catalog pages show the signed-in visitor's cart size in the navbar, so
+their ETag must change whenever that cart does. Every write to a cart or
+its items drops the owner's version (see ``signals.py``) and the next read
+picks a new random one. If the cache is unreachable every read gets a new
+version, so pages are re-rendered instead of answered with a stale 304.
+"""
+import uuid
+
+from django.core.cache import cache
+
+VERSION_TTL = 60 * 60 * 24
+
+
+def cart_version_key(user_id):
+    return f'cart:version:{user_id}'
+
+
+def cart_version(user_id):
+    return cache.get_or_set(cart_version_key(user_id), lambda: uuid.uuid4().hex, VERSION_TTL)
+
+
+def invalidate(user_id):
+    cache.delete(cart_version_key(user_id))
@@ -1,10 +1,14 @@
 from django.contrib import admin
+from django.db.models import Q
+from django.utils.html import format_html, format_html_join
+from .archive import read_archive
 from .models import ChatRoom, ChatMessage, SupportStaff
+from .search import search as search_transcripts
 
 class ChatMessageInline(admin.TabularInline):
     model = ChatMessage
     extra = 0
-    readonly_fields = ('sender', 'message', 'timestamp', 'is_read')
+    readonly_fields = ('sender', 'message', 'seq', 'timestamp')
     can_delete = False
     
     def has_add_permission(self, request, obj=None):
@@ -15,7 +19,7 @@ class ChatRoomAdmin(admin.ModelAdmin):
     list_display = ('room_id', 'name', 'user', 'support_staff', 'is_active', 'created_at')
     list_filter = ('is_active', 'created_at')
     search_fields = ('room_id', 'name', 'user__username', 'support_staff__username')
-    readonly_fields = ('room_id', 'user', 'created_at', 'updated_at')
+    readonly_fields = ('room_id', 'user', 'created_at', 'updated_at', 'archived_at', 'archived_transcript')
     inlines = [ChatMessageInline]
     
     fieldsets = (
@@ -26,14 +30,46 @@ class ChatRoomAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
+        ('Archive', {
+            'fields': ('archived_at', 'archived_transcript'),
+            'classes': ('collapse',)
+        }),
     )
+    
+    def archived_transcript(self, obj):
+        # Read from cold storage only when a single room is opened
+        if obj is None or obj.archived_at is None:
+            return 'Not archived'
+        records = read_archive(obj)
+        if not records:
+            return 'Archive file is empty or missing'
+        rows = format_html_join(
+            '',
+            '<tr><td>{}</td><td>{}</td><td>{}</td></tr>',
+            ((record['timestamp'], record['sender'], record['message']) for record in records)
+        )
+        return format_html(
+            '<table><thead><tr><th>Timestamp</th><th>Sender</th><th>Message</th></tr></thead>'
+            '<tbody>{}</tbody></table>',
+            rows
+        )
+    archived_transcript.short_description = 'Archived messages'
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
-    list_display = ('__str__', 'room', 'sender', 'timestamp', 'is_read')
-    list_filter = ('is_read', 'timestamp', 'room')
+    list_display = ('__str__', 'room', 'sender', 'seq', 'timestamp')
+    list_filter = ('timestamp', 'room')
     search_fields = ('message', 'sender__username')
     readonly_fields = ('room', 'sender', 'timestamp')
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Answer from the inverted index instead of LIKE scans of every
+        # message. Senders match by username prefix, which the username
+        # index can serve, rather than anywhere in the name.
+        if not search_term:
+            return queryset, False
+        matches = search_transcripts(search_term).values('message')
+        return queryset.filter(Q(pk__in=matches) | Q(sender__username__istartswith=search_term)), False
 
 @admin.register(SupportStaff)
 class SupportStaffAdmin(admin.ModelAdmin):
@@ -0,0 +1,114 @@
+"""
+Cold storage for the messages of closed chat rooms.
+
+Rooms closed for longer than ``CHAT_ARCHIVE_AFTER_DAYS`` have their messages
+streamed, in sequence order, into a gzip-compressed newline-delimited JSON
+file under ``CHAT_ARCHIVE_ROOT`` and are then deleted from
+``chat_chatmessage`` in small chunks so no long-running lock is held. The
+file is written to a temporary name and renamed into place before anything
+is deleted, so an interrupted run never loses messages.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ChatRoom, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ROOT = Path(getattr(settings, 'CHAT_ARCHIVE_ROOT', Path(settings.BASE_DIR) / 'archive' / 'chat'))
+ARCHIVE_AFTER_DAYS = getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 30)
+BATCH_SIZE = getattr(settings, 'CHAT_ARCHIVE_BATCH_SIZE', 1000)
+
+
+def archive_path(room):
+    # Shard by the first characters of the room id to keep directories small
+    return ARCHIVE_ROOT / room.room_id[:2] / f'{room.room_id}.jsonl.gz'
+
+
+def rooms_due(days=ARCHIVE_AFTER_DAYS):
+    """
+    Closed rooms inactive for ``days`` that still have messages in the
+    table. ``archived_at`` only records the last run, so a room that was
+    reopened and closed again is picked up once more.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    return ChatRoom.objects.filter(
+        Exists(ChatMessage.objects.filter(room=OuterRef('pk'))),
+        is_active=False,
+        updated_at__lt=cutoff,
+    ).order_by('updated_at')
+
+
+def _message_record(message):
+    return {
+        'id': message['id'],
+        'seq': message['seq'],
+        'sender_id': message['sender_id'],
+        'sender': message['sender__username'],
+        'message': message['message'],
+        'timestamp': message['timestamp'].isoformat(),
+    }
+
+
+def write_archive(room, batch_size=BATCH_SIZE):
+    """
+    Stream a room's messages into its archive file, returning the ids written
+    """
+    path = archive_path(room)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + '.tmp')
+
+    message_ids = []
+    messages = ChatMessage.objects.filter(room=room).order_by('seq', 'id').values(
+        'id', 'seq', 'sender_id', 'sender__username', 'message', 'timestamp'
+    )
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as archive:
+        # Copy any earlier archive of the room first, e.g. if it was
+        # reopened, one line at a time
+        if path.exists():
+            with gzip.open(path, 'rt', encoding='utf-8') as previous:
+                for line in previous:
+                    archive.write(line)
+        for message in messages.iterator(chunk_size=batch_size):
+            archive.write(json.dumps(_message_record(message)) + '\n')
+            message_ids.append(message['id'])
+    os.replace(temp_path, path)
+    return message_ids
+
+
+def delete_archived_messages(message_ids, batch_size=BATCH_SIZE):
+    deleted = 0
+    for start in range(0, len(message_ids), batch_size):
+        chunk = message_ids[start:start + batch_size]
+        deleted += ChatMessage.objects.filter(pk__in=chunk).delete()[0]
+    return deleted
+
+
+def archive_room(room, batch_size=BATCH_SIZE):
+    """
+    Move one room's messages to cold storage. Returns the number archived.
+    """
+    message_ids = write_archive(room, batch_size)
+    deleted = delete_archived_messages(message_ids, batch_size)
+    ChatRoom.objects.filter(pk=room.pk).update(archived_at=timezone.now())
+    logger.info(f"Archived {deleted} message(s) of room {room.room_id} to {archive_path(room)}")
+    return deleted
+
+
+def read_archive(room):
+    """
+    Load a room's archived messages as dicts, oldest first
+    """
+    path = archive_path(room)
+    if not path.exists():
+        return []
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        return [json.loads(line) for line in archive if line.strip()]
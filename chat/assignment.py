@@ -0,0 +1,148 @@
+"""
+Support agent routing for chat rooms.
+
+Each agent's load lives in the denormalized ``SupportStaff.active_chat_count``
+column, which is only ever changed with single-row ``F()`` updates, so checking
+capacity is O(1) instead of a COUNT over the agent's rooms. Available agents
+form a ready queue ordered by load, served straight from the
+``(is_online, is_available, active_chat_count)`` index.
+
+Rooms are claimed with a compare-and-set UPDATE on ``support_staff IS NULL``,
+so two agents (or an agent and the auto-assigner) can never both win a room.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import F, Count
+from django.utils import timezone
+
+from .models import ChatRoom, SupportStaff
+from .room_cache import invalidate_room
+
+logger = logging.getLogger('django.channels')
+
+# Number of agents from the head of the ready queue tried per assignment
+CANDIDATE_BATCH = 5
+
+
+class AssignmentConflict(Exception):
+    """
+    Raised inside the assignment transaction to roll back a lost race
+    """
+
+
+def ready_queue(limit=CANDIDATE_BATCH):
+    """
+    Available agents with spare capacity, least loaded first
+    """
+    return SupportStaff.objects.filter(
+        is_online=True,
+        is_available=True,
+        active_chat_count__lt=F('max_concurrent_chats'),
+    ).order_by('active_chat_count', 'last_activity')[:limit]
+
+
+def assign_room(room, staff, enforce_capacity=True):
+    """
+    Atomically assign an unassigned room to ``staff``.
+
+    Returns True when the room was claimed. Returns False if another agent
+    got there first or, with ``enforce_capacity``, the agent is full.
+    """
+    try:
+        with transaction.atomic():
+            counter = SupportStaff.objects.filter(pk=staff.pk)
+            if enforce_capacity:
+                counter = counter.filter(active_chat_count__lt=F('max_concurrent_chats'))
+            if not counter.update(active_chat_count=F('active_chat_count') + 1):
+                raise AssignmentConflict('Agent has no spare capacity')
+
+            claimed = ChatRoom.objects.filter(
+                pk=room.pk,
+                support_staff__isnull=True,
+            ).update(support_staff_id=staff.user_id, updated_at=timezone.now())
+            if not claimed:
+                raise AssignmentConflict('Room already assigned')
+    except AssignmentConflict:
+        return False
+
+    room.support_staff_id = staff.user_id
+    room._loaded_support_staff_id = staff.user_id
+    # Queryset updates bypass signals, so invalidate the room lists here
+    transaction.on_commit(lambda: invalidate_room(room, None))
+    return True
+
+
+def auto_assign(room):
+    """
+    Assign a newly created room to the least loaded available agent.
+    Returns the assigned SupportStaff, or None if nobody could take it.
+    """
+    # Retry a few times in case every candidate of a batch raced away
+    for _ in range(3):
+        candidates = list(ready_queue())
+        if not candidates:
+            break
+        for staff in candidates:
+            if assign_room(room, staff):
+                logger.debug(f"Room {room.room_id} auto-assigned to {staff.user_id}")
+                return staff
+            if ChatRoom.objects.filter(pk=room.pk, support_staff__isnull=False).exists():
+                return None
+    return None
+
+
+def assign_waiting_rooms(staff):
+    """
+    Fill an agent's spare capacity from the oldest unassigned rooms
+    """
+    assigned = 0
+    waiting = ChatRoom.objects.filter(
+        support_staff__isnull=True,
+        is_active=True,
+    ).order_by('created_at')
+
+    for room in waiting[:max(staff.max_concurrent_chats - staff.active_chat_count, 0)]:
+        if not assign_room(room, staff):
+            break
+        assigned += 1
+    return assigned
+
+
+def close_room(room):
+    """
+    Close a room exactly once and release its agent's capacity
+    """
+    with transaction.atomic():
+        closed = ChatRoom.objects.filter(pk=room.pk, is_active=True).update(
+            is_active=False, updated_at=timezone.now()
+        )
+        if closed and room.support_staff_id:
+            SupportStaff.objects.filter(
+                user_id=room.support_staff_id,
+                active_chat_count__gt=0,
+            ).update(active_chat_count=F('active_chat_count') - 1)
+
+    room.is_active = False
+    if closed:
+        transaction.on_commit(lambda: invalidate_room(room, room.support_staff_id))
+    return bool(closed)
+
+
+def rebuild_active_chat_counts():
+    """
+    Recompute every agent's counter from the rooms table, for repairs after
+    manual edits (e.g. through the admin)
+    """
+    counts = dict(
+        ChatRoom.objects.filter(is_active=True, support_staff__isnull=False)
+        .values_list('support_staff')
+        .annotate(total=Count('id'))
+    )
+    updated = 0
+    for staff in SupportStaff.objects.only('pk', 'user_id', 'active_chat_count'):
+        count = counts.get(staff.user_id, 0)
+        if staff.active_chat_count != count:
+            SupportStaff.objects.filter(pk=staff.pk).update(active_chat_count=count)
+            updated += 1
+    return updated
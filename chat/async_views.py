@@ -0,0 +1,168 @@
+"""
+Async-native versions of the hot chat API endpoints.
+
+These views run on daphne's event loop instead of inside a thread like the
+sync DRF viewsets: reads use the async ORM and async cache calls, and only
+the room-locking message insert is handed to a thread as a whole. The ORM
+and the cache have no async drivers, so their calls still run on the
+request's worker thread; what the event loop gains is that waiting in the
+view (rate limiting, cache and database round trips) no longer blocks that
+thread. This only holds while every middleware can run async, see
+``SERVE_STATIC`` in settings. Responses have the same shape as the
+``/chat/api/`` viewsets.
+"""
+import json
+import math
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from rest_framework.authentication import CSRFCheck
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from ecommerce.db import routers
+
+from . import ratelimit
+from .fast_serializers import aread_cursors, aserialize_messages, aserialize_rooms, message_dict, message_rows
+from .models import ChatReadCursor, ChatRoom
+from .room_cache import aget_room_summaries, ainvalidate_user_rooms
+from .serializers import ChatMessageSerializer
+from .views import visible_messages, visible_rooms
+from .ws_auth import verify_token
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _csrf_failure(request):
+    # Session-authenticated writes need a CSRF token, as with DRF's
+    # SessionAuthentication; bearer tokens do not. CSRFCheck returns the
+    # failure reason instead of a response.
+    check = CSRFCheck(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+async def _authenticate(request):
+    """
+    Return ``(user, error_response)`` from a JWT bearer token or the session.
+    The user comes with ``support_profile`` loaded so role checks never
+    query the database from the event loop.
+    """
+    users = User.objects.select_related('support_profile').filter(is_active=True)
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        try:
+            claims = verify_token(header[len('Bearer '):].strip())
+        except jwt.PyJWTError:
+            return None, JsonResponse({'detail': 'Given token not valid for any token type'}, status=401)
+        user = await users.filter(pk=claims.get(jwt_settings.USER_ID_CLAIM)).afirst()
+        if user is None:
+            return None, JsonResponse({'detail': 'User not found'}, status=401)
+        return user, None
+
+    session_user = await request.auser()
+    if not session_user.is_authenticated:
+        return None, JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    failure = _csrf_failure(request)
+    if failure is not None:
+        return None, JsonResponse({'detail': f'CSRF Failed: {failure}'}, status=403)
+    return await users.aget(pk=session_user.pk), None
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+@csrf_exempt
+@require_GET
+async def room_list(request):
+    user, error = await _authenticate(request)
+    if error:
+        return error
+    summaries = await aget_room_summaries(user, lambda: aserialize_rooms(visible_rooms(user)))
+    return JsonResponse(summaries, safe=False)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+async def message_list(request):
+    user, error = await _authenticate(request)
+    if error:
+        return error
+    if request.method == 'GET':
+        with routers.replica_scope(request, user):
+            return JsonResponse(await aserialize_messages(message_rows(visible_messages(user))), safe=False)
+    return await _create_message(request, user)
+
+
+async def _create_message(request, user):
+    data = _request_data(request)
+    if data is None:
+        return _error('Invalid JSON body', 400)
+
+    room = await ChatRoom.objects.filter(room_id=data.get('room_id')).afirst()
+    if room is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    if not (user.id == room.user_id or user.id == room.support_staff_id or
+            (hasattr(user, 'support_profile') and room.support_staff_id is None)):
+        return _error('Not authorized to send messages in this room', 403)
+
+    serializer = ChatMessageSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    retry_after = await ratelimit.acheck(ratelimit.MESSAGE, user.id, room.room_id)
+    if retry_after:
+        wait = math.ceil(retry_after)
+        response = JsonResponse(
+            {'detail': f'Request was throttled. Expected available in {wait} seconds.'},
+            status=429
+        )
+        response['Retry-After'] = str(wait)
+        return response
+
+    # The sequence number is handed out under a row lock inside a
+    # transaction, which the async ORM cannot do yet
+    chat_message = await sync_to_async(room.append_message)(user, serializer.validated_data['message'])
+    # Read-your-writes for clients that do not keep the pin cookie
+    await routers.apin_user(user.id)
+    row = {
+        'id': chat_message.id,
+        'room_id': room.id,
+        'sender_id': user.id,
+        'sender__username': user.username,
+        'sender__support_profile__id': getattr(getattr(user, 'support_profile', None), 'id', None),
+        'message': chat_message.message,
+        'seq': chat_message.seq,
+        'timestamp': chat_message.timestamp,
+    }
+    return JsonResponse(message_dict(row, await aread_cursors([room.id])), status=201)
+
+
+@csrf_exempt
+@require_POST
+async def mark_read(request):
+    user, error = await _authenticate(request)
+    if error:
+        return error
+    data = _request_data(request)
+    room_id = data.get('room_id') if data is not None else None
+    if not room_id:
+        return _error('Room ID is required', 400)
+
+    room = await ChatRoom.objects.filter(room_id=room_id).afirst()
+    if room is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    await ChatReadCursor.amark_read(room, user)
+    await ainvalidate_user_rooms(user.id)
+    return JsonResponse({'status': 'messages marked as read'})
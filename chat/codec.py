@@ -0,0 +1,118 @@
+"""
+Compact event encoding for chat channel-layer traffic.
+
+Every group_send carries a WebSocket frame that has already been serialized
+once by the sender, so the per-subscriber handlers forward it untouched
+instead of running ``json.dumps`` for each recipient. Frames use one-letter
+keys, integer user ids and epoch-millisecond timestamps; clients resolve
+user ids to usernames from the roster frame sent on connect (kept current by
+join frames, which are the only ones carrying a username).
+
+Frame layout (``t`` is the frame type):
+
+    r  roster        {"t":"r","users":{"<id>":"<username>",...}}
+    m  chat message  {"t":"m","id":<message id>,"q":<room seq>,"u":<user id>,"m":"<text>","ts":<ms>}
+    j  user join     {"t":"j","u":<user id>,"n":"<username>","ts":<ms>}
+    l  user leave    {"t":"l","u":<user id>,"ts":<ms>}
+    y  user typing   {"t":"y","u":<user id>,"y":0|1}
+    s  resync hint   {"t":"s"}, sent before a slow consumer is disconnected;
+                     {"t":"s","r":1} asks for a full reload when a gap
+                     is too large to replay
+    x  rate limited  {"t":"x","ra":<ms>}, the last message was refused;
+                     retry after ``ra`` milliseconds
+
+Typing and presence events also carry a coalesce key so a congested
+connection can keep only the latest state per user (see chat/outbound.py).
+"""
+import json
+
+from django.utils import timezone
+
+ROSTER = 'r'
+CHAT_MESSAGE = 'm'
+USER_JOIN = 'j'
+USER_LEAVE = 'l'
+USER_TYPING = 'y'
+RESYNC = 's'
+RATE_LIMITED = 'x'
+
+# Key holding the pre-serialized frame inside a channel-layer event
+FRAME_KEY = 'f'
+# Key holding the coalesce key of droppable events
+COALESCE_KEY = 'k'
+
+
+def _dumps(frame):
+    return json.dumps(frame, separators=(',', ':'), ensure_ascii=False)
+
+
+def epoch_ms(value=None):
+    value = value or timezone.now()
+    return int(value.timestamp() * 1000)
+
+
+def roster_frame(users):
+    """
+    ``users`` maps user ids to usernames
+    """
+    return _dumps({'t': ROSTER, 'users': {str(user_id): name for user_id, name in users.items()}})
+
+
+def chat_message_frame(message_id, seq, user_id, message, timestamp):
+    return _dumps({
+        't': CHAT_MESSAGE, 'id': message_id, 'q': seq, 'u': user_id, 'm': message, 'ts': epoch_ms(timestamp)
+    })
+
+
+def message_frame(chat_message):
+    """
+    Frame for a saved ChatMessage instance
+    """
+    return chat_message_frame(
+        chat_message.id, chat_message.seq, chat_message.sender_id, chat_message.message, chat_message.timestamp
+    )
+
+
+def user_join_frame(user_id, username):
+    return _dumps({'t': USER_JOIN, 'u': user_id, 'n': username, 'ts': epoch_ms()})
+
+
+def user_leave_frame(user_id):
+    return _dumps({'t': USER_LEAVE, 'u': user_id, 'ts': epoch_ms()})
+
+
+def user_typing_frame(user_id, is_typing):
+    return _dumps({'t': USER_TYPING, 'u': user_id, 'y': 1 if is_typing else 0})
+
+
+def resync_frame(reload=False):
+    frame = {'t': RESYNC}
+    if reload:
+        frame['r'] = 1
+    return _dumps(frame)
+
+
+def rate_limited_frame(retry_after):
+    """
+    ``retry_after`` is in seconds
+    """
+    return _dumps({'t': RATE_LIMITED, 'ra': int(retry_after * 1000)})
+
+
+def typing_key(user_id):
+    return f'{USER_TYPING}:{user_id}'
+
+
+def presence_key(user_id):
+    return f'p:{user_id}'
+
+
+def group_event(handler, frame, coalesce_key=None):
+    """
+    Wrap a serialized frame in a channel-layer event for ``handler``.
+    Events with a ``coalesce_key`` may be coalesced or dropped under pressure.
+    """
+    event = {'type': handler, FRAME_KEY: frame}
+    if coalesce_key is not None:
+        event[COALESCE_KEY] = coalesce_key
+    return event
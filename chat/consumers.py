@@ -1,42 +1,72 @@
+import asyncio
 import json
+import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
-from django.utils import timezone
-from .models import ChatRoom, ChatMessage
+from ecommerce.db import routers
+from .models import ChatRoom
+from . import codec, metrics, ratelimit, replay
+from .telemetry import REJECT_FORBIDDEN, REJECT_INVALID_TOKEN, REJECT_MISSING_TOKEN
+from .outbound import OutboundQueue
+from .ws_auth import parse_query, verify_token
 import jwt
 from django.conf import settings
 
+logger = logging.getLogger('django.channels')
+
+# Outbound frames buffered per connection before shedding typing/presence
+SEND_QUEUE_SIZE = getattr(settings, 'CHAT_SEND_QUEUE_SIZE', 100)
+# Frames an acking client may hold unacknowledged before sends pause
+ACK_WINDOW = getattr(settings, 'CHAT_ACK_WINDOW', 50)
+# Seconds a connection may stay congested before it is disconnected
+SLOW_CONSUMER_TIMEOUT = getattr(settings, 'CHAT_SLOW_CONSUMER_TIMEOUT', 10)
+# Close code telling the client to resync after reconnecting
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.room_group_name = f'chat_{self.room_id}'
         
         # Get the token from the query string and authenticate
-        query_string = self.scope.get('query_string', b'').decode('utf-8')
-        token = None
-        for param in query_string.split('&'):
-            if param.startswith('token='):
-                token = param.split('=')[1]
-                break
+        query = parse_query(self.scope)
+        token = query.get('token')
+        resume_from = None
+        if 'resume_from' in query:
+            # Last message sequence number the reconnecting client has seen
+            try:
+                resume_from = int(query['resume_from'])
+            except ValueError:
+                resume_from = None
         
         if not token:
             # No token provided, reject the connection
-            await self.close()
+            await self.close(code=REJECT_MISSING_TOKEN)
             return
         
         try:
-            # Verify the JWT token
-            payload = jwt.decode(token, settings.SIMPLE_JWT['SIGNING_KEY'], algorithms=[settings.SIMPLE_JWT['ALGORITHM']])
+            # Verify the JWT token, reusing claims of tokens seen before
+            payload = verify_token(token)
             user_id = payload[settings.SIMPLE_JWT['USER_ID_CLAIM']]
             self.user = await self.get_user(user_id)
             
             # Check if user has access to this room
             has_access = await self.check_room_access(self.user, self.room_id)
             if not has_access:
-                await self.close()
+                await self.close(code=REJECT_FORBIDDEN)
                 return
             
+            # Buffer group events per connection; the writer starts after accept
+            self.outbound = OutboundQueue(
+                self.send,
+                SEND_QUEUE_SIZE,
+                # Clients connecting with ?ack=1 report frames they processed
+                window=ACK_WINDOW if 'ack' in query else None,
+                on_drop=lambda: metrics.incr(self.room_id, 'dropped'),
+                on_coalesce=lambda: metrics.incr(self.room_id, 'coalesced'),
+            )
+            
             # Add the user to the room group
             await self.channel_layer.group_add(
                 self.room_group_name,
@@ -44,23 +74,43 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
             
             await self.accept()
+            self.writer_task = asyncio.ensure_future(self.outbound.run())
+            
+            # Send the room roster so frames only need to carry user ids
+            roster = await self.get_room_roster(self.room_id)
+            self.outbound.put(codec.roster_frame(roster))
+            
+            # Replay only what a reconnecting client missed
+            if resume_from is not None:
+                frames = await self.get_missed_frames(self.room_id, resume_from)
+                if frames is None:
+                    self.outbound.put(codec.resync_frame(reload=True))
+                else:
+                    for frame in frames:
+                        self.outbound.put(frame)
+                    metrics.incr(self.room_id, 'replayed', len(frames))
             
             # Notify other users that this user has joined
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
-                    'type': 'user_join',
-                    'user_id': self.user.id,
-                    'username': self.user.username,
-                    'timestamp': timezone.now().isoformat(),
-                }
+                codec.group_event(
+                    'user_join',
+                    codec.user_join_frame(self.user.id, self.user.username),
+                    coalesce_key=codec.presence_key(self.user.id)
+                )
             )
             
         except jwt.PyJWTError:
             # Invalid token, reject the connection
-            await self.close()
+            await self.close(code=REJECT_INVALID_TOKEN)
     
     async def disconnect(self, close_code):
+        # Stop the writer before leaving the group
+        if hasattr(self, 'outbound'):
+            self.outbound.close()
+        if hasattr(self, 'writer_task'):
+            self.writer_task.cancel()
+        
         # Leave the room group
         try:
             await self.channel_layer.group_discard(
@@ -72,12 +122,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if hasattr(self, 'user'):
                 await self.channel_layer.group_send(
                     self.room_group_name,
-                    {
-                        'type': 'user_leave',
-                        'user_id': self.user.id,
-                        'username': self.user.username,
-                        'timestamp': timezone.now().isoformat(),
-                    }
+                    codec.group_event(
+                        'user_leave',
+                        codec.user_leave_frame(self.user.id),
+                        coalesce_key=codec.presence_key(self.user.id)
+                    )
                 )
         except:
             pass
@@ -89,75 +138,78 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if message_type == 'chat_message':
             message = text_data_json['message']
             
+            retry_after = await ratelimit.acheck(ratelimit.MESSAGE, self.user.id, self.room_id)
+            if retry_after:
+                # Refuse the message and tell only this client
+                metrics.incr(self.room_id, 'rate_limited')
+                self.outbound.put(codec.rate_limited_frame(retry_after))
+                return
+            
             # Save the message to the database
-            chat_message = await self.save_message(
+            frame = await self.save_message(
                 room_id=self.room_id,
                 user=self.user,
                 message=message
             )
             
-            # Send message to room group
+            # Send message to room group, serialized once for all subscribers
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
-                    'type': 'chat_message',
-                    'message': message,
-                    'user_id': self.user.id,
-                    'username': self.user.username,
-                    'timestamp': chat_message['timestamp'],
-                    'message_id': chat_message['id']
-                }
+                codec.group_event('chat_message', frame)
             )
         elif message_type == 'typing':
+            # Typing is shed silently, before messages get limited
+            if await ratelimit.acheck(ratelimit.TYPING, self.user.id, self.room_id):
+                metrics.incr(self.room_id, 'typing_shed')
+                return
+            
             # Send typing notification to room group
             is_typing = text_data_json.get('is_typing', False)
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
-                    'type': 'user_typing',
-                    'user_id': self.user.id,
-                    'username': self.user.username,
-                    'is_typing': is_typing
-                }
+                codec.group_event(
+                    'user_typing',
+                    codec.user_typing_frame(self.user.id, is_typing),
+                    coalesce_key=codec.typing_key(self.user.id)
+                )
             )
+        elif message_type == 'ack':
+            # Number of frames the client has processed on this connection
+            try:
+                self.outbound.ack(int(text_data_json['n']))
+            except (KeyError, TypeError, ValueError):
+                pass
     
+    # Group event handlers queue the pre-serialized frame for the writer
     async def chat_message(self, event):
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message'],
-            'user_id': event['user_id'],
-            'username': event['username'],
-            'timestamp': event['timestamp'],
-            'message_id': event['message_id']
-        }))
+        await self.forward(event)
     
     async def user_join(self, event):
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'user_join',
-            'user_id': event['user_id'],
-            'username': event['username'],
-            'timestamp': event['timestamp']
-        }))
+        await self.forward(event)
     
     async def user_leave(self, event):
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'user_leave',
-            'user_id': event['user_id'],
-            'username': event['username'],
-            'timestamp': event['timestamp']
-        }))
+        await self.forward(event)
     
     async def user_typing(self, event):
-        # Send typing notification to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'user_typing',
-            'user_id': event['user_id'],
-            'username': event['username'],
-            'is_typing': event['is_typing']
-        }))
+        await self.forward(event)
+    
+    async def forward(self, event):
+        outbound = getattr(self, 'outbound', None)
+        if outbound is None or outbound.closed:
+            return
+        queued = outbound.put(event[codec.FRAME_KEY], event.get(codec.COALESCE_KEY))
+        if not queued or outbound.congested_for() > SLOW_CONSUMER_TIMEOUT:
+            await self.disconnect_slow_consumer()
+    
+    async def disconnect_slow_consumer(self):
+        """
+        Drop a client that cannot keep up, asking it to resync on reconnect
+        """
+        metrics.incr(self.room_id, 'slow_consumer_disconnects')
+        logger.info(f"Disconnecting slow consumer in room {self.room_id}")
+        self.outbound.close()
+        await self.send(text_data=codec.resync_frame())
+        await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
     
     @database_sync_to_async
     def get_user(self, user_id):
@@ -177,23 +229,28 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except ChatRoom.DoesNotExist:
             return False
     
+    @database_sync_to_async
+    def get_room_roster(self, room_id):
+        room = ChatRoom.objects.select_related('user', 'support_staff').get(room_id=room_id)
+        roster = {room.user_id: room.user.username}
+        if room.support_staff is not None:
+            roster[room.support_staff_id] = room.support_staff.username
+        return roster
+    
+    @database_sync_to_async
+    def get_missed_frames(self, room_id, after_seq):
+        room = ChatRoom.objects.get(room_id=room_id)
+        return replay.missed_frames(room, after_seq)
+    
     @database_sync_to_async
     def save_message(self, room_id, user, message):
         # Get the room
         room = ChatRoom.objects.get(room_id=room_id)
         
-        # Update room timestamp
-        room.updated_at = timezone.now()
-        room.save()
-        
-        # Create the message
-        chat_message = ChatMessage.objects.create(
-            room=room,
-            sender=user,
-            message=message
-        )
+        # Create the message with the room's next sequence number, which
+        # also updates the room timestamp
+        chat_message = room.append_message(user, message)
+        # No HTTP response to carry the pin cookie, so pin the user directly
+        routers.pin_user(user.id)
         
-        return {
-            'id': chat_message.id,
-            'timestamp': chat_message.timestamp.isoformat()
-        } 
\ No newline at end of file
+        return codec.message_frame(chat_message)
@@ -0,0 +1,148 @@
+"""
+Fast-path serialization for the chat API's read endpoints.
+
+Produces the same output as ``ChatMessageSerializer`` and
+``ChatRoomSerializer`` but builds plain dicts straight from ``.values()``
+rows: no model instances, no per-row DRF field binding, and read cursors and
+last messages are fetched with one query per page instead of one per row.
+Writes still go through the regular serializers for validation.
+"""
+from django.db.models import OuterRef, Subquery
+from rest_framework import serializers
+
+from .models import ChatMessage, ChatReadCursor
+
+MESSAGE_VALUES = (
+    'id', 'room_id', 'sender_id', 'sender__username', 'sender__support_profile__id',
+    'message', 'seq', 'timestamp',
+)
+# Rooms must be annotated with the viewer's ``read_seq``, as
+# ChatRoomViewSet.get_queryset does
+ROOM_VALUES = (
+    'id', 'room_id', 'name',
+    'user_id', 'user__username', 'user__support_profile__id',
+    'support_staff_id', 'support_staff__username', 'support_staff__support_profile__id',
+    'is_active', 'created_at', 'updated_at', 'last_seq', 'read_seq', 'last_message_id',
+)
+
+# A single unbound field formats every timestamp exactly like the serializers
+_datetime = serializers.DateTimeField().to_representation
+
+
+def _user(user_id, username, support_profile_id):
+    if user_id is None:
+        return None
+    return {'id': user_id, 'username': username, 'is_support': support_profile_id is not None}
+
+
+def _cursor_map(room_ids, rows):
+    cursors = {room_id: {} for room_id in room_ids}
+    for room_id, user_id, read_seq in rows:
+        cursors[room_id][user_id] = read_seq
+    return cursors
+
+
+def _cursor_rows(room_ids):
+    return ChatReadCursor.objects.filter(room_id__in=room_ids).values_list('room_id', 'user_id', 'read_seq')
+
+
+def read_cursors(room_ids):
+    """
+    Map of room id to ``{user_id: read_seq}`` for the given rooms
+    """
+    room_ids = set(room_ids)
+    return _cursor_map(room_ids, _cursor_rows(room_ids))
+
+
+async def aread_cursors(room_ids):
+    room_ids = set(room_ids)
+    return _cursor_map(room_ids, [row async for row in _cursor_rows(room_ids)])
+
+
+def message_dict(row, cursors):
+    timestamp = row['timestamp']
+    sender_id = row['sender_id']
+    seq = row['seq']
+    return {
+        'id': row['id'],
+        'room': row['room_id'],
+        'sender': _user(sender_id, row['sender__username'], row['sender__support_profile__id']),
+        'message': row['message'],
+        'seq': seq,
+        'timestamp': _datetime(timestamp),
+        'formatted_timestamp': timestamp.strftime("%b %d, %Y %H:%M"),
+        'is_read': any(
+            read_seq >= seq
+            for user_id, read_seq in cursors.get(row['room_id'], {}).items()
+            if user_id != sender_id
+        ),
+    }
+
+
+def message_rows(queryset):
+    return queryset.values(*MESSAGE_VALUES)
+
+
+def serialize_messages(rows):
+    """
+    Serialize message value rows (see ``message_rows``)
+    """
+    rows = list(rows)
+    cursors = read_cursors(row['room_id'] for row in rows)
+    return [message_dict(row, cursors) for row in rows]
+
+
+async def aserialize_messages(rows):
+    rows = [row async for row in rows]
+    cursors = await aread_cursors(row['room_id'] for row in rows)
+    return [message_dict(row, cursors) for row in rows]
+
+
+def _room_rows(queryset):
+    last_message = ChatMessage.objects.filter(
+        room=OuterRef('pk')
+    ).order_by('-timestamp', '-id').values('id')[:1]
+    return queryset.annotate(last_message_id=Subquery(last_message)).values(*ROOM_VALUES)
+
+
+def _last_message_rows(room_rows):
+    message_ids = [row['last_message_id'] for row in room_rows if row['last_message_id']]
+    return message_rows(ChatMessage.objects.filter(id__in=message_ids))
+
+
+def _room_dict(row, last_messages):
+    return {
+        'id': row['id'],
+        'room_id': row['room_id'],
+        'name': row['name'],
+        'user': _user(row['user_id'], row['user__username'], row['user__support_profile__id']),
+        'support_staff': _user(
+            row['support_staff_id'], row['support_staff__username'],
+            row['support_staff__support_profile__id']
+        ),
+        'is_active': row['is_active'],
+        'created_at': _datetime(row['created_at']),
+        'updated_at': _datetime(row['updated_at']),
+        'last_message': last_messages.get(row['last_message_id']),
+        'unread_count': max(row['last_seq'] - row['read_seq'], 0),
+    }
+
+
+def serialize_rooms(queryset):
+    """
+    Serialize a ``read_seq``-annotated room queryset with each room's last
+    message, in three queries regardless of the number of rooms
+    """
+    rows = list(_room_rows(queryset))
+    last_messages = {}
+    if any(row['last_message_id'] for row in rows):
+        last_messages = {message['id']: message for message in serialize_messages(_last_message_rows(rows))}
+    return [_room_dict(row, last_messages) for row in rows]
+
+
+async def aserialize_rooms(queryset):
+    rows = [row async for row in _room_rows(queryset)]
+    last_messages = {}
+    if any(row['last_message_id'] for row in rows):
+        last_messages = {message['id']: message for message in await aserialize_messages(_last_message_rows(rows))}
+    return [_room_dict(row, last_messages) for row in rows]
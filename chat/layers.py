@@ -0,0 +1,86 @@
+"""
+Sharded Redis channel layer.
+
+``channels_redis`` splits keys over its hosts by cutting the CRC32 space into
+``len(hosts)`` equal ranges, so adding or removing a Redis host moves most
+groups to a different shard. This layer places every host on a hash ring
+with virtual nodes instead: a room's ``chat_{room_id}`` group stays on the
+same host as long as that host exists, and resizing the pool only remaps
+about ``1/len(hosts)`` of the keys.
+
+Ring points are placed by host identity, not by position in the host list,
+so removing a host from the middle of ``CHANNEL_REDIS_URLS`` leaves the
+other hosts' keys where they are. The identity is the host's address
+without credentials, or an explicit ``name`` in a host dict.
+"""
+import bisect
+import hashlib
+from urllib.parse import urlsplit
+
+from channels_redis.core import RedisChannelLayer
+from channels_redis.utils import create_pool
+
+# Points per host on the ring; more points give a more even spread
+VIRTUAL_NODES = 160
+
+
+def _ring_position(value):
+    return int.from_bytes(hashlib.md5(value).digest()[:8], 'big')
+
+
+def host_identity(host):
+    """
+    Stable name of a channels_redis host dict, e.g. ``redis-channels-1:6379/0``
+    """
+    if host.get('name'):
+        return host['name']
+    if 'address' in host:
+        parts = urlsplit(host['address'])
+        return f"{parts.hostname}:{parts.port or 6379}{parts.path or '/0'}"
+    if 'master_name' in host:
+        return host['master_name']
+    return f"{host.get('host', 'localhost')}:{host.get('port', 6379)}/{host.get('db', 0)}"
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to the indexes of ``names``
+    """
+
+    def __init__(self, names, virtual_nodes=VIRTUAL_NODES):
+        if len(set(names)) != len(names):
+            raise ValueError(f"Channel layer hosts must be distinct: {names}")
+        self.size = len(names)
+        points = sorted(
+            (_ring_position(f'{name}-{replica}'.encode()), index)
+            for index, name in enumerate(names)
+            for replica in range(virtual_nodes)
+        )
+        self._positions = [position for position, _ in points]
+        self._shards = [index for _, index in points]
+
+    def get_shard(self, key):
+        if self.size == 1:
+            return 0
+        if isinstance(key, str):
+            key = key.encode('utf8')
+        position = bisect.bisect(self._positions, _ring_position(key)) % len(self._positions)
+        return self._shards[position]
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer whose hosts are selected through a consistent hash ring
+    """
+
+    def __init__(self, *args, virtual_nodes=VIRTUAL_NODES, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hash_ring = HashRing([host_identity(host) for host in self.hosts], virtual_nodes)
+
+    def create_pool(self, index):
+        # ``name`` only places the host on the ring
+        host = {key: value for key, value in self.hosts[index].items() if key != 'name'}
+        return create_pool(host)
+
+    def consistent_hash(self, value):
+        return self.hash_ring.get_shard(value)
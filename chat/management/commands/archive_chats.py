@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from chat.archive import ARCHIVE_AFTER_DAYS, BATCH_SIZE, archive_room, rooms_due
+
+
+class Command(BaseCommand):
+    help = "Move messages of rooms closed for more than N days to compressed cold storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                            help="Archive rooms closed for more than this many days")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help="Messages streamed and deleted per batch")
+        parser.add_argument('--limit', type=int, default=None, help="Maximum rooms to archive in this run")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the rooms that would be archived")
+
+    def handle(self, *args, **options):
+        rooms = rooms_due(options['days'])
+        if options['limit']:
+            rooms = rooms[:options['limit']]
+
+        archived_rooms = 0
+        archived_messages = 0
+        for room in rooms.iterator():
+            if options['dry_run']:
+                self.stdout.write(f"Would archive room {room.room_id} (closed {room.updated_at:%Y-%m-%d})")
+                continue
+            archived_messages += archive_room(room, options['batch_size'])
+            archived_rooms += 1
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Archived {archived_messages} message(s) from {archived_rooms} room(s)"
+            ))
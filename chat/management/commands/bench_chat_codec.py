@@ -0,0 +1,73 @@
+import json
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat import codec
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare channel-layer bytes and per-fan-out CPU of the legacy verbose "
+        "chat events against the compact pre-serialized frames"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=50, help="Connections in the room group")
+        parser.add_argument('--events', type=int, default=2000, help="group_send calls to simulate")
+        parser.add_argument('--message-length', type=int, default=80)
+
+    def handle(self, *args, **options):
+        subscribers = options['subscribers']
+        events = options['events']
+        text = 'x' * options['message_length']
+        now = timezone.now()
+
+        legacy_event = {
+            'type': 'chat_message',
+            'message': text,
+            'user_id': 1234,
+            'username': 'support-agent-example',
+            'timestamp': now.isoformat(),
+            'message_id': 987654,
+        }
+
+        def legacy_fanout():
+            # channels_redis packs the event for every channel in the group and
+            # each consumer re-serializes it to JSON
+            for _ in range(subscribers):
+                event = msgpack.unpackb(msgpack.packb(legacy_event))
+                json.dumps({
+                    'type': 'chat_message',
+                    'message': event['message'],
+                    'user_id': event['user_id'],
+                    'username': event['username'],
+                    'timestamp': event['timestamp'],
+                    'message_id': event['message_id'],
+                })
+
+        def compact_fanout():
+            # The frame is serialized once by the sender; handlers forward it
+            event = codec.group_event('chat_message', codec.chat_message_frame(987654, 1, 1234, text, now))
+            for _ in range(subscribers):
+                msgpack.unpackb(msgpack.packb(event))[codec.FRAME_KEY]
+
+        compact_event = codec.group_event('chat_message', codec.chat_message_frame(987654, 1, 1234, text, now))
+        results = [
+            ('Legacy verbose event', legacy_event, legacy_fanout),
+            ('Compact frame event', compact_event, compact_fanout),
+        ]
+
+        self.stdout.write(f"{events} group_send calls, {subscribers} subscribers each")
+        for label, event, fanout in results:
+            size = len(msgpack.packb(event))
+            started = time.perf_counter()
+            for _ in range(events):
+                fanout()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{label}: {size} bytes/event, {size * subscribers} Redis bytes/fan-out, "
+                f"{elapsed / events * 1e6:.1f} us CPU/fan-out"
+            )
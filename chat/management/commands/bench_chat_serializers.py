@@ -0,0 +1,100 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import IntegerField, Value
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from chat.fast_serializers import message_rows, serialize_messages, serialize_rooms
+from chat.models import ChatMessage, ChatRoom, SupportStaff
+from chat.serializers import ChatMessageSerializer, ChatRoomSerializer
+
+
+class RollbackBenchmark(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare objects/sec of the DRF ModelSerializers against the value-row "
+        "fast path used by the chat API's read endpoints. All data is created "
+        "inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000, help="Messages in the benchmark room")
+        parser.add_argument('--rooms', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=3, help="Best of N runs")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.benchmark(**options)
+                raise RollbackBenchmark()
+        except RollbackBenchmark:
+            self.stdout.write("Benchmark data rolled back.")
+
+    def benchmark(self, messages, rooms, repeat, **options):
+        prefix = uuid.uuid4().hex[:6]
+        customer = User.objects.create(username=f'bench-{prefix}-customer')
+        agent = User.objects.create(username=f'bench-{prefix}-agent')
+        SupportStaff.objects.create(user=agent, is_online=True)
+
+        ChatRoom.objects.bulk_create([
+            ChatRoom(name=f'Room {i}', room_id=f'{prefix}{i}', user=customer, support_staff=agent)
+            for i in range(rooms)
+        ])
+        room_queryset = ChatRoom.objects.filter(room_id__startswith=prefix)
+        room = room_queryset.order_by('id').first()
+        now = timezone.now()
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                room=room,
+                sender=customer if i % 2 else agent,
+                message=f'Benchmark message number {i}',
+                seq=i + 1,
+                timestamp=now,
+            )
+            for i in range(messages)
+        ])
+        # Give every other room a last message
+        ChatMessage.objects.bulk_create([
+            ChatMessage(room=other, sender=customer, message='Hello', seq=1, timestamp=now)
+            for other in room_queryset.exclude(pk=room.pk)
+        ])
+        room_queryset.exclude(pk=room.pk).update(last_seq=1)
+        ChatRoom.objects.filter(pk=room.pk).update(last_seq=messages)
+
+        message_queryset = ChatMessage.objects.filter(room=room).select_related(
+            'sender__support_profile'
+        ).order_by('timestamp')
+        # The viewset annotates the viewer's read cursor; zero is enough here
+        annotated_rooms = room_queryset.annotate(read_seq=Value(0, output_field=IntegerField()))
+
+        cases = [
+            ('Messages, ChatMessageSerializer', messages,
+             lambda: ChatMessageSerializer(message_queryset, many=True).data),
+            ('Messages, fast path', messages,
+             lambda: serialize_messages(message_rows(message_queryset))),
+            ('Rooms, ChatRoomSerializer', rooms,
+             lambda: ChatRoomSerializer(annotated_rooms, many=True).data),
+            ('Rooms, fast path', rooms,
+             lambda: serialize_rooms(annotated_rooms)),
+        ]
+        for label, count, serialize in cases:
+            best = None
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    serialize()
+                    elapsed = time.perf_counter() - started
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, len(queries))
+            elapsed, query_count = best
+            self.stdout.write(
+                f"{label}: {count / elapsed:,.0f} objects/sec "
+                f"({elapsed * 1000:.1f} ms, {query_count} queries)"
+            )
@@ -0,0 +1,109 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+ENDPOINTS = {
+    'rooms': ('/chat/api/rooms/', '/chat/api/async/rooms/'),
+    'messages': ('/chat/api/messages/', '/chat/api/async/messages/'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test a running server with concurrent GETs against the sync DRF "
+        "chat endpoints and their async-native counterparts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="User whose access token is sent with every request")
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='rooms')
+        parser.add_argument('--concurrency', type=int, default=200, help="Requests in flight at once")
+        parser.add_argument('--requests', type=int, default=5000, help="Requests per variant")
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--only', choices=['sync', 'async'], help="Load only one of the variants")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+        token = str(AccessToken.for_user(user))
+
+        url = urlsplit(options['base_url'])
+        if url.scheme != 'http':
+            raise CommandError("Only plain http:// targets are supported")
+        host, port = url.hostname, url.port or 80
+
+        sync_path, async_path = ENDPOINTS[options['endpoint']]
+        self.stdout.write(
+            f"{options['requests']} requests per variant, {options['concurrency']} concurrent, "
+            f"against {options['base_url']}"
+        )
+        variants = {'sync': ('Sync DRF view', sync_path), 'async': ('Async view', async_path)}
+        if options['only']:
+            variants = {options['only']: variants[options['only']]}
+        for label, path in variants.values():
+            latencies, errors, elapsed = asyncio.run(self.run_load(
+                host, port, path, token,
+                options['requests'], options['concurrency'], options['timeout']
+            ))
+            self.report(label, path, latencies, errors, elapsed)
+
+    async def run_load(self, host, port, path, token, total, concurrency, timeout):
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            f"Authorization: Bearer {token}\r\n"
+            f"Accept: application/json\r\n"
+            f"Connection: close\r\n\r\n"
+        ).encode()
+        latencies = []
+        errors = []
+        remaining = iter(range(total))
+
+        async def fetch():
+            started = time.perf_counter()
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+                await reader.read()
+            finally:
+                writer.close()
+            status = int(status_line.split()[1]) if status_line else 0
+            if status != 200:
+                raise RuntimeError(f"HTTP {status}")
+            return time.perf_counter() - started
+
+        async def worker():
+            for _ in remaining:
+                try:
+                    latencies.append(await asyncio.wait_for(fetch(), timeout))
+                except Exception as exc:
+                    errors.append(str(exc) or exc.__class__.__name__)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - started
+
+    def report(self, label, path, latencies, errors, elapsed):
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f"{label} ({path}): every request failed, e.g. {errors[:1]}"))
+            return
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+        self.stdout.write(
+            f"{label} ({path}): {len(latencies) / elapsed:,.0f} req/s, "
+            f"p50={percentile(0.50):.1f}ms p95={percentile(0.95):.1f}ms p99={percentile(0.99):.1f}ms "
+            f"mean={statistics.mean(latencies) * 1000:.1f}ms, {len(errors)} error(s)"
+        )
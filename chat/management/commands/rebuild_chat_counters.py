@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from chat.assignment import rebuild_active_chat_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute SupportStaff.active_chat_count from the active rooms"
+
+    def handle(self, *args, **options):
+        updated = rebuild_active_chat_counts()
+        self.stdout.write(self.style.SUCCESS(f"Corrected {updated} support staff counter(s)"))
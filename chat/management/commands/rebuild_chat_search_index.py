@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the chat transcript search index from the stored messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Messages read per query")
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} message(s)"))
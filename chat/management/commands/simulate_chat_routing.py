@@ -0,0 +1,110 @@
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from chat.assignment import auto_assign
+from chat.models import ChatRoom, SupportStaff
+
+
+class RollbackSimulation(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate routing of chat rooms to support agents and compare the "
+        "counter-based assignment engine with per-agent COUNT queries. "
+        "All data is created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10000)
+        parser.add_argument('--agents', type=int, default=500)
+        parser.add_argument('--capacity', type=int, default=20, help="max_concurrent_chats per agent")
+        parser.add_argument('--legacy-sample', type=int, default=200,
+                            help="Rooms routed with the legacy COUNT-per-agent scan")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.simulate(**options)
+                raise RollbackSimulation()
+        except RollbackSimulation:
+            self.stdout.write("Simulation data rolled back.")
+
+    def simulate(self, rooms, agents, capacity, legacy_sample, **options):
+        prefix = uuid.uuid4().hex[:6]
+        self.stdout.write(f"Creating {agents} agents and {rooms} rooms...")
+
+        staff_users = User.objects.bulk_create([
+            User(username=f'sim-{prefix}-agent-{i}') for i in range(agents)
+        ])
+        if staff_users[0].pk is None:
+            # Backends without RETURNING (MySQL) need the ids fetched back
+            staff_users = list(User.objects.filter(username__startswith=f'sim-{prefix}-agent-'))
+        SupportStaff.objects.bulk_create([
+            SupportStaff(user=user, is_online=True, is_available=True, max_concurrent_chats=capacity)
+            for user in staff_users
+        ])
+        customer = User.objects.create(username=f'sim-{prefix}-customer')
+        ChatRoom.objects.bulk_create([
+            ChatRoom(name=f'Room {i}', room_id=f'{prefix}{i}', user=customer)
+            for i in range(rooms)
+        ])
+        room_list = list(ChatRoom.objects.filter(room_id__startswith=prefix).order_by('id'))
+        staff_list = list(SupportStaff.objects.filter(user__in=staff_users).select_related('user'))
+
+        # Legacy: scan agents with a COUNT per agent until one has capacity
+        sample = room_list[:legacy_sample]
+        with CaptureQueriesContext(connection) as legacy_queries:
+            started = time.perf_counter()
+            for room in sample:
+                for staff in staff_list:
+                    count = ChatRoom.objects.filter(support_staff=staff.user, is_active=True).count()
+                    if staff.is_online and staff.is_available and count < staff.max_concurrent_chats:
+                        room.support_staff = staff.user
+                        room.save(update_fields=['support_staff'])
+                        break
+            legacy_elapsed = time.perf_counter() - started
+        ChatRoom.objects.filter(pk__in=[room.pk for room in sample]).update(support_staff=None)
+        for room in sample:
+            room.support_staff = None
+
+        # Engine: ready queue + compare-and-set claim
+        assigned = 0
+        with CaptureQueriesContext(connection) as engine_queries:
+            started = time.perf_counter()
+            for room in room_list:
+                if auto_assign(room):
+                    assigned += 1
+            engine_elapsed = time.perf_counter() - started
+
+        loads = list(
+            SupportStaff.objects.filter(pk__in=[staff.pk for staff in staff_list])
+            .values_list('active_chat_count', flat=True)
+        )
+        actual = ChatRoom.objects.filter(room_id__startswith=prefix, support_staff__isnull=False).count()
+
+        self.report('Legacy COUNT scan', len(sample), legacy_elapsed, len(legacy_queries))
+        self.report('Assignment engine', len(room_list), engine_elapsed, len(engine_queries))
+        self.stdout.write(f"Rooms assigned: {assigned}/{len(room_list)} (rooms table: {actual})")
+        self.stdout.write(
+            f"Agent load: min={min(loads)} max={max(loads)} "
+            f"stdev={statistics.pstdev(loads):.2f}"
+        )
+        if sum(loads) != actual:
+            self.stdout.write(self.style.ERROR("Counter drift detected: counters do not match the rooms table"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Counters consistent, no double assignment"))
+
+    def report(self, label, rooms, elapsed, queries):
+        per_room = elapsed / rooms * 1000 if rooms else 0
+        self.stdout.write(
+            f"{label}: {rooms} rooms in {elapsed:.2f}s "
+            f"({per_room:.3f} ms/room, {queries / max(rooms, 1):.1f} queries/room)"
+        )
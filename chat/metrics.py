@@ -0,0 +1,42 @@
+"""
+In-process counters for chat delivery, keyed by room.
+
+Counters are per daphne process and reset on restart; they are meant to be
+scraped or inspected (e.g. from ``manage.py shell``) rather than persisted.
+"""
+import threading
+from collections import Counter, defaultdict
+
+_lock = threading.Lock()
+_room_counters = defaultdict(Counter)
+
+
+def incr(room_id, name, amount=1):
+    with _lock:
+        _room_counters[room_id][name] += amount
+
+
+def room_snapshot(room_id):
+    with _lock:
+        return dict(_room_counters.get(room_id, {}))
+
+
+def snapshot():
+    """
+    Return a copy of every room's counters
+    """
+    with _lock:
+        return {room_id: dict(counters) for room_id, counters in _room_counters.items()}
+
+
+def totals():
+    with _lock:
+        combined = Counter()
+        for counters in _room_counters.values():
+            combined.update(counters)
+        return dict(combined)
+
+
+def reset():
+    with _lock:
+        _room_counters.clear()
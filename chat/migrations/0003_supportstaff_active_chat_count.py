@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_active_chat_count(apps, schema_editor):
+    SupportStaff = apps.get_model('chat', 'SupportStaff')
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    counts = dict(
+        ChatRoom.objects.filter(is_active=True, support_staff__isnull=False)
+        .values_list('support_staff')
+        .annotate(total=Count('id'))
+    )
+    for staff in SupportStaff.objects.all():
+        staff.active_chat_count = counts.get(staff.user_id, 0)
+        staff.save(update_fields=['active_chat_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_alter_supportstaff_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supportstaff',
+            name='active_chat_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='supportstaff',
+            index=models.Index(fields=['is_online', 'is_available', 'active_chat_count'], name='chat_suppor_is_onli_c9c75e_idx'),
+        ),
+        migrations.RunPython(populate_active_chat_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+def backfill_sequences(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    for room in ChatRoom.objects.all().iterator():
+        seq = 0
+        message_ids = ChatMessage.objects.filter(room=room).order_by('timestamp', 'id').values_list('id', flat=True)
+        for message_id in message_ids.iterator():
+            seq += 1
+            ChatMessage.objects.filter(pk=message_id).update(seq=seq)
+        ChatRoom.objects.filter(pk=room.pk).update(last_seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_supportstaff_active_chat_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['room', 'seq'], name='chat_chatme_room_id_8e61cb_idx'),
+        ),
+    ]
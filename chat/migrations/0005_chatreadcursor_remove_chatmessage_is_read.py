@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-18 11:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Q
+
+
+def backfill_read_cursors(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    ChatReadCursor = apps.get_model('chat', 'ChatReadCursor')
+    cursors = []
+    for room in ChatRoom.objects.all().iterator():
+        for user_id in {room.user_id, room.support_staff_id} - {None}:
+            # A participant has read their own messages and every flagged one
+            read_seq = ChatMessage.objects.filter(
+                Q(sender_id=user_id) | Q(is_read=True),
+                room=room
+            ).aggregate(read_seq=Max('seq'))['read_seq'] or 0
+            cursors.append(ChatReadCursor(room_id=room.pk, user_id=user_id, read_seq=read_seq))
+    ChatReadCursor.objects.bulk_create(cursors, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_chatroom_last_seq_chatmessage_seq'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_seq', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='chat.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('room', 'user'), name='unique_read_cursor_per_room_user')],
+            },
+        ),
+        migrations.RunPython(backfill_read_cursors, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='chat_chatme_room_id_396ee6_idx',
+        ),
+        migrations.RemoveField(
+            model_name='chatmessage',
+            name='is_read',
+        ),
+    ]
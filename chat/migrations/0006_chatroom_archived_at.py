@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_chatreadcursor_remove_chatmessage_is_read'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 14:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_chatroom_archived_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessageTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('timestamp', models.DateTimeField()),
+                ('frequency', models.PositiveSmallIntegerField(default=1)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='chat.chatmessage')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='chat.chatroom')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'timestamp'], name='chat_chatme_term_ee1d97_idx'), models.Index(fields=['term', 'room'], name='chat_chatme_term_644875_idx')],
+            },
+        ),
+    ]
@@ -1,5 +1,9 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class ChatRoom(models.Model):
     """
@@ -19,12 +23,37 @@ class ChatRoom(models.Model):
         related_name='support_rooms'
     )
     is_active = models.BooleanField(default=True)
+    # Sequence number of the latest message in this room
+    last_seq = models.PositiveBigIntegerField(default=0)
+    # When the room's messages were last moved to cold storage
+    archived_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Chat {self.room_id} - {self.user.username}"
     
+    def append_message(self, sender, message):
+        """
+        Create a message carrying the room's next sequence number
+        """
+        with transaction.atomic():
+            # Lock the room row so sequence numbers are handed out in order
+            room = ChatRoom.objects.select_for_update().get(pk=self.pk)
+            room.last_seq += 1
+            room.save(update_fields=['last_seq', 'updated_at'])
+            chat_message = ChatMessage.objects.create(
+                room=room,
+                sender=sender,
+                message=message,
+                seq=room.last_seq
+            )
+            # Replying implies having read everything before it
+            ChatReadCursor.mark_read(room, sender, room.last_seq)
+        self.last_seq = room.last_seq
+        self.updated_at = room.updated_at
+        return chat_message
+    
     class Meta:
         ordering = ['-updated_at']
         indexes = [
@@ -43,8 +72,9 @@ class ChatMessage(models.Model):
     room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     message = models.TextField()
+    # Per-room, monotonically increasing position used for resync
+    seq = models.PositiveBigIntegerField(default=0)
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
     
     def __str__(self):
         return f"{self.sender.username}: {self.message[:50]}"
@@ -54,8 +84,82 @@ class ChatMessage(models.Model):
         indexes = [
             models.Index(fields=['room', 'timestamp']),
             models.Index(fields=['sender']),
-            models.Index(fields=['room', 'is_read']),
-            models.Index(fields=['timestamp'])
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['room', 'seq'])
+        ]
+
+class ChatMessageTerm(models.Model):
+    """
+    Inverted index posting: one row per distinct search term of a message.
+    Room and timestamp are copied from the message so filters and time
+    ordering never have to touch chat_chatmessage (see chat.search).
+    """
+    term = models.CharField(max_length=64)
+    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='search_terms')
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='search_terms')
+    timestamp = models.DateTimeField()
+    frequency = models.PositiveSmallIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.term} -> {self.message_id}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'timestamp']),
+            models.Index(fields=['term', 'room'])
+        ]
+
+class ChatReadCursor(models.Model):
+    """
+    How far a participant has read a room, as a message sequence number.
+    Unread count for the participant is ``room.last_seq - read_seq``.
+    """
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_cursors')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_read_cursors')
+    read_seq = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user.username} read {self.room.room_id} up to {self.read_seq}"
+    
+    @classmethod
+    def mark_read(cls, room, user, seq=None):
+        """
+        Move the user's cursor forward to ``seq`` (the room's latest message
+        by default). A cursor never moves back, so a caller holding a stale
+        ``room.last_seq`` cannot undo a newer read.
+        """
+        if seq is None:
+            seq = room.last_seq
+        cursors = cls.objects.filter(room=room, user=user)
+        advance = {
+            'read_seq': Greatest(F('read_seq'), Value(seq), output_field=models.PositiveBigIntegerField()),
+            'updated_at': timezone.now(),
+        }
+        # Usually one UPDATE; MySQL cannot name a conflict target for an upsert
+        if cursors.update(**advance):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(room=room, user=user, read_seq=seq)
+        except IntegrityError:
+            # Created concurrently
+            cursors.update(**advance)
+    
+    @classmethod
+    async def amark_read(cls, room, user, seq=None):
+        await sync_to_async(cls.mark_read)(room, user, seq)
+    
+    @classmethod
+    def cursors_for_room(cls, room_id):
+        """
+        Map of user id to read_seq for every participant of a room
+        """
+        return dict(cls.objects.filter(room_id=room_id).values_list('user_id', 'read_seq'))
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'user'], name='unique_read_cursor_per_room_user')
         ]
 
 class SupportStaff(models.Model):
@@ -66,6 +170,9 @@ class SupportStaff(models.Model):
     is_online = models.BooleanField(default=False)
     is_available = models.BooleanField(default=True)
     max_concurrent_chats = models.IntegerField(default=3)
+    # Denormalized number of active rooms assigned to this agent, maintained
+    # atomically by chat.assignment
+    active_chat_count = models.PositiveIntegerField(default=0)
     last_activity = models.DateTimeField(auto_now=True)
     
     def __str__(self):
@@ -73,7 +180,7 @@ class SupportStaff(models.Model):
     
     @property
     def current_chat_count(self):
-        return self.support_rooms.filter(is_active=True).count()
+        return self.active_chat_count
     
     @property
     def can_take_new_chat(self):
@@ -83,5 +190,7 @@ class SupportStaff(models.Model):
         verbose_name_plural = 'Support Staff'
         indexes = [
             models.Index(fields=['is_online', 'is_available']),
-            models.Index(fields=['user'])
+            models.Index(fields=['user']),
+            # Ready queue of available agents ordered by load
+            models.Index(fields=['is_online', 'is_available', 'active_chat_count'])
         ]
@@ -0,0 +1,139 @@
+"""
+Bounded outbound queue for a single WebSocket connection.
+
+Group event handlers only enqueue frames; a dedicated writer task drains the
+queue to the socket. The consumer therefore keeps pulling from the channel
+layer while a slow client catches up, instead of letting the channel's Redis
+buffer overflow and lose messages.
+
+Droppable frames (typing and presence) carry a coalesce key. A new frame
+replaces a still-pending frame with the same key, and when the queue is full
+droppable frames are shed first. Only when the queue is full of
+non-droppable frames does ``put`` fail, which tells the consumer that the
+client is too slow to keep up.
+
+The server's ``send`` returns as soon as the frame is handed to the
+transport, so the queue alone never sees a client that stopped reading.
+Clients that opt into acks report how many frames they have processed, and
+the writer keeps at most ``window`` frames unacknowledged. A client that
+stops reading therefore backs frames up into this queue, where congestion
+is visible to the consumer.
+"""
+import asyncio
+import time
+from collections import deque
+
+
+class OutboundQueue:
+    def __init__(self, send, maxsize, window=None, on_drop=None, on_coalesce=None):
+        self._send = send
+        self.maxsize = maxsize
+        # Frames the client may hold unacknowledged, None when it never acks
+        self.window = window
+        self.sent = 0
+        self.acked = 0
+        self._on_drop = on_drop or (lambda: None)
+        self._on_coalesce = on_coalesce or (lambda: None)
+        # Entries are [frame, coalesce_key] lists so pending frames can be
+        # replaced in place
+        self._queue = deque()
+        self._pending = {}
+        self._ready = asyncio.Event()
+        self._congested_since = None
+        self.closed = False
+
+    def __len__(self):
+        return len(self._queue)
+
+    @property
+    def in_flight(self):
+        return self.sent - self.acked
+
+    @property
+    def high_watermark(self):
+        return max(int(self.maxsize * 0.8), 1)
+
+    def put(self, frame, coalesce_key=None):
+        """
+        Queue a frame. Returns False if it could not be queued because the
+        queue is full of frames that may not be dropped.
+        """
+        if coalesce_key is not None:
+            entry = self._pending.get(coalesce_key)
+            if entry is not None:
+                entry[0] = frame
+                self._on_coalesce()
+                return True
+
+        if len(self._queue) >= self.maxsize:
+            if coalesce_key is not None:
+                # Shed the droppable frame itself
+                self._on_drop()
+                return True
+            if not self._evict_droppable():
+                return False
+
+        entry = [frame, coalesce_key]
+        self._queue.append(entry)
+        if coalesce_key is not None:
+            self._pending[coalesce_key] = entry
+        self._track_congestion()
+        self._ready.set()
+        return True
+
+    def _evict_droppable(self):
+        for entry in self._queue:
+            if entry[1] is not None:
+                self._queue.remove(entry)
+                del self._pending[entry[1]]
+                self._on_drop()
+                return True
+        return False
+
+    def _track_congestion(self):
+        if len(self._queue) >= self.high_watermark:
+            if self._congested_since is None:
+                self._congested_since = time.monotonic()
+        else:
+            self._congested_since = None
+
+    def congested_for(self):
+        """
+        Seconds the queue has stayed above its high watermark
+        """
+        if self._congested_since is None:
+            return 0.0
+        return time.monotonic() - self._congested_since
+
+    def ack(self, count):
+        """
+        Record that the client has processed its first ``count`` frames
+        """
+        count = min(count, self.sent)
+        if count > self.acked:
+            self.acked = count
+            self._ready.set()
+
+    async def run(self):
+        """
+        Writer loop, run as a task for the lifetime of the connection
+        """
+        while not self.closed:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queue and not self.closed:
+                if self.window is not None and self.in_flight >= self.window:
+                    # Wait for an ack, leaving the backlog queued
+                    break
+                frame, coalesce_key = self._queue.popleft()
+                if coalesce_key is not None:
+                    self._pending.pop(coalesce_key, None)
+                self._track_congestion()
+                self.sent += 1
+                await self._send(text_data=frame)
+
+    def close(self):
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        self._ready.set()
@@ -0,0 +1,78 @@
+"""
+Cursor-based message history for chat rooms.
+
+Pages walk the ``(room, timestamp)`` index backwards from the newest message.
+A cursor encodes the timestamp and id of the oldest message already loaded,
+so fetching an older page never needs an OFFSET scan.
+"""
+import base64
+import binascii
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatMessage
+
+# Number of messages rendered initially and returned per history page
+MESSAGE_PAGE_SIZE = getattr(settings, 'CHAT_MESSAGE_PAGE_SIZE', 50)
+MAX_MESSAGE_PAGE_SIZE = 200
+
+
+def encode_cursor(message):
+    # Accepts both model instances and ``.values()`` rows
+    if isinstance(message, dict):
+        timestamp, message_id = message['timestamp'], message['id']
+    else:
+        timestamp, message_id = message.timestamp, message.id
+    raw = f'{timestamp.isoformat()}|{message_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor into ``(timestamp, id)``, raising ValueError if invalid
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, message_id = raw.rsplit('|', 1)
+        parsed = parse_datetime(timestamp)
+        if parsed is None:
+            raise ValueError('Invalid cursor timestamp')
+        return parsed, int(message_id)
+    except (binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def message_history(room, before=None, limit=MESSAGE_PAGE_SIZE, values=None):
+    """
+    Return ``(messages, next_cursor)`` for a room.
+
+    ``messages`` holds up to ``limit`` messages older than the ``before``
+    cursor (or the newest ones without it) in chronological order.
+    ``next_cursor`` points at the next older page, or is None when the
+    beginning of the conversation has been reached. With ``values`` the
+    messages are returned as ``.values(*values)`` rows, which must include
+    ``id`` and ``timestamp``.
+    """
+    queryset = ChatMessage.objects.filter(room=room).select_related(
+        'sender__support_profile'
+    ).order_by('-timestamp', '-id')
+
+    if before:
+        timestamp, message_id = decode_cursor(before)
+        queryset = queryset.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id)
+        )
+
+    if values:
+        queryset = queryset.values(*values)
+
+    # Fetch one extra row to learn whether an older page exists
+    messages = list(queryset[:limit + 1])
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+
+    next_cursor = encode_cursor(messages[0]) if has_more else None
+    return messages, next_cursor
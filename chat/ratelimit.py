@@ -0,0 +1,165 @@
+"""
+Token-bucket flood control for chat messages and typing events.
+
+Every sender draws from two buckets, one per user and one per room, and a
+frame is accepted only if both can pay for it. The check runs as a single
+Lua script in Redis, so all web instances share the buckets and concurrent
+frames cannot overdraw them. If Redis is unreachable the limiter falls back
+to per-process buckets instead of letting floods through, and keeps using
+them for ``CHAT_RATE_LIMIT_REDIS_RETRY`` seconds before trying Redis again.
+
+Typing events share the buckets but cost a fraction of a message and are
+refused once a bucket drops below ``CHAT_TYPING_RESERVE`` of its burst. Under
+pressure typing is shed first, which leaves the remaining tokens for real
+messages.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger('django.channels')
+
+MESSAGE = 'message'
+TYPING = 'typing'
+
+# Sustained rate (tokens per second) and burst size of each bucket
+USER_RATE = getattr(settings, 'CHAT_USER_RATE', 1.0)
+USER_BURST = getattr(settings, 'CHAT_USER_BURST', 10)
+ROOM_RATE = getattr(settings, 'CHAT_ROOM_RATE', 5.0)
+ROOM_BURST = getattr(settings, 'CHAT_ROOM_BURST', 30)
+# Tokens a typing event costs, and the share of a bucket it may not touch
+TYPING_COST = getattr(settings, 'CHAT_TYPING_COST', 0.2)
+TYPING_RESERVE = getattr(settings, 'CHAT_TYPING_RESERVE', 0.5)
+
+# Per-process buckets kept when Redis is unavailable
+LOCAL_BUCKETS_MAX = 10000
+# Seconds to stay on the local buckets after Redis fails
+REDIS_RETRY_INTERVAL = getattr(settings, 'CHAT_RATE_LIMIT_REDIS_RETRY', 5)
+
+# KEYS are the buckets; ARGV holds rate, burst, cost and reserve per bucket.
+# Tokens are only taken if every bucket can pay. Returns 0 when allowed,
+# otherwise the milliseconds until the frame would be accepted.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local base = (i - 1) * 4
+    local rate = tonumber(ARGV[base + 1])
+    local burst = tonumber(ARGV[base + 2])
+    local need = tonumber(ARGV[base + 3]) + tonumber(ARGV[base + 4])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or burst
+    local last = tonumber(state[2]) or now
+    level = math.min(burst, level + math.max(0, now - last) * rate / 1000)
+    levels[i] = level
+    if level < need then
+        wait = math.max(wait, math.ceil((need - level) * 1000 / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local base = (i - 1) * 4
+    local rate = tonumber(ARGV[base + 1])
+    local burst = tonumber(ARGV[base + 2])
+    redis.call('HSET', key, 'tokens', levels[i] - tonumber(ARGV[base + 3]), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 1000)
+end
+return 0
+"""
+
+_script = None
+_local_buckets = OrderedDict()
+_local_lock = threading.Lock()
+# Monotonic time before which Redis is not tried, None while it is healthy
+_redis_down_until = None
+_state_lock = threading.Lock()
+
+
+def _buckets(kind, user_id, room_id):
+    """
+    ``(key, rate, burst, cost, reserve)`` for every bucket a frame draws from
+    """
+    cost, reserve_share = (TYPING_COST, TYPING_RESERVE) if kind == TYPING else (1, 0)
+    return [
+        (f'chat_rl:user:{user_id}', USER_RATE, USER_BURST, cost, USER_BURST * reserve_share),
+        (f'chat_rl:room:{room_id}', ROOM_RATE, ROOM_BURST, cost, ROOM_BURST * reserve_share),
+    ]
+
+
+def _check_redis(buckets):
+    global _script
+    if _script is None:
+        from django_redis import get_redis_connection
+        _script = get_redis_connection('default').register_script(TOKEN_BUCKET_SCRIPT)
+    args = []
+    for _, rate, burst, cost, reserve in buckets:
+        args.extend([rate, burst, cost, reserve])
+    return int(_script(keys=[bucket[0] for bucket in buckets], args=args)) / 1000
+
+
+def _check_local(buckets):
+    now = time.monotonic()
+    with _local_lock:
+        levels = []
+        wait = 0
+        for key, rate, burst, cost, reserve in buckets:
+            level, last = _local_buckets.get(key, (burst, now))
+            level = min(burst, level + (now - last) * rate)
+            levels.append(level)
+            if level < cost + reserve:
+                wait = max(wait, (cost + reserve - level) / rate)
+        if wait:
+            return wait
+        for (key, rate, burst, cost, reserve), level in zip(buckets, levels):
+            _local_buckets[key] = (level - cost, now)
+            _local_buckets.move_to_end(key)
+        while len(_local_buckets) > LOCAL_BUCKETS_MAX:
+            _local_buckets.popitem(last=False)
+    return 0
+
+
+def check(kind, user_id, room_id):
+    """
+    Take tokens for a ``MESSAGE`` or ``TYPING`` frame. Returns 0 if the frame
+    may go through, otherwise the seconds to wait before retrying.
+    """
+    buckets = _buckets(kind, user_id, room_id)
+    down_until = _redis_down_until
+    if down_until is None or time.monotonic() >= down_until:
+        try:
+            wait = _check_redis(buckets)
+        except Exception as exc:
+            _redis_failed(exc)
+        else:
+            if down_until is not None:
+                _redis_recovered()
+            return wait
+    return _check_local(buckets)
+
+
+def _redis_failed(exc):
+    global _redis_down_until
+    with _state_lock:
+        if _redis_down_until is None:
+            logger.warning(f"Rate limiter falling back to local buckets: {exc}")
+        _redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+
+
+def _redis_recovered():
+    global _redis_down_until
+    with _state_lock:
+        if _redis_down_until is not None:
+            logger.info("Rate limiter using Redis again")
+        _redis_down_until = None
+
+
+# Redis round trip off the event loop for WebSocket consumers
+acheck = sync_to_async(check, thread_sensitive=False)
@@ -0,0 +1,80 @@
+"""
+Replay of missed chat messages for reconnecting WebSocket clients.
+
+The frames of each room's most recent messages are kept in a Redis sorted
+set scored by sequence number. A client reconnecting with ``resume_from=<seq>``
+gets the gap replayed from that ring when it covers it contiguously, and
+from the ``(room, seq)`` index otherwise. Redis errors are never fatal: the
+ring is only an accelerator in front of the database.
+"""
+import logging
+
+from django.conf import settings
+
+from . import codec
+from .models import ChatMessage
+
+logger = logging.getLogger('django.channels')
+
+# Recent message frames kept per room
+RING_SIZE = getattr(settings, 'CHAT_REPLAY_BUFFER_SIZE', 200)
+RING_TTL = 60 * 60  # 1 hour
+# Largest gap replayed over the socket; bigger gaps ask the client to reload
+MAX_REPLAY = getattr(settings, 'CHAT_MAX_REPLAY', 500)
+
+
+def _ring_key(room_id):
+    return f'chat_ring:{room_id}'
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def remember(room_id, seq, frame):
+    """
+    Add a message frame to the room's ring buffer
+    """
+    key = _ring_key(room_id)
+    try:
+        pipe = _redis().pipeline()
+        pipe.zadd(key, {frame: seq})
+        # Keep only the newest RING_SIZE entries
+        pipe.zremrangebyrank(key, 0, -(RING_SIZE + 1))
+        pipe.expire(key, RING_TTL)
+        pipe.execute()
+    except Exception as exc:
+        logger.warning(f"Could not update replay buffer for room {room_id}: {exc}")
+
+
+def _from_ring(room_id, after_seq, last_seq):
+    try:
+        entries = _redis().zrangebyscore(_ring_key(room_id), f'({after_seq}', '+inf', withscores=True)
+    except Exception as exc:
+        logger.warning(f"Could not read replay buffer for room {room_id}: {exc}")
+        return None
+
+    # Only trust the ring if it holds every message of the gap
+    if len(entries) != last_seq - after_seq or int(entries[0][1]) != after_seq + 1:
+        return None
+    return [frame.decode() if isinstance(frame, bytes) else frame for frame, _ in entries]
+
+
+def missed_frames(room, after_seq):
+    """
+    Return the frames of messages after ``after_seq`` in order, or None if
+    the gap is larger than MAX_REPLAY
+    """
+    last_seq = room.last_seq
+    if after_seq >= last_seq:
+        return []
+    if last_seq - after_seq > MAX_REPLAY:
+        return None
+
+    frames = _from_ring(room.room_id, after_seq, last_seq)
+    if frames is not None:
+        return frames
+
+    messages = ChatMessage.objects.filter(room=room, seq__gt=after_seq).order_by('seq')
+    return [codec.message_frame(message) for message in messages[:MAX_REPLAY]]
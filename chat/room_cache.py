@@ -0,0 +1,125 @@
+"""
+Materialized room-summary cache for the chat room list endpoint.
+
+Room lists are stored as already-serialized data per user and role, so a
+cache hit never touches the database. Support staff lists also embed a
+generation counter for the shared pool of unassigned rooms: any change to an
+unassigned room bumps the counter and thereby invalidates every support
+list at once without having to enumerate them.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+# Cache time in seconds
+CACHE_TTL = getattr(settings, 'CACHE_TIMEOUT', 900)  # 15 minutes default
+ROOM_SUMMARY_TTL = CACHE_TTL // 2  # Shorter TTL for dynamic data
+
+POOL_GENERATION_KEY = 'chat_rooms:pool_generation'
+
+
+def is_support_user(user):
+    return hasattr(user, 'support_profile')
+
+
+def _pool_generation():
+    generation = cache.get(POOL_GENERATION_KEY)
+    if generation is None:
+        generation = 0
+        cache.add(POOL_GENERATION_KEY, generation, None)
+    return generation
+
+
+def room_summary_key(user_id, is_support):
+    """
+    Build the cache key holding the serialized room list for a user
+    """
+    if is_support:
+        return f'chat_rooms:{user_id}:support:{_pool_generation()}'
+    return f'chat_rooms:{user_id}:customer'
+
+
+async def _apool_generation():
+    generation = await cache.aget(POOL_GENERATION_KEY)
+    if generation is None:
+        generation = 0
+        await cache.aadd(POOL_GENERATION_KEY, generation, None)
+    return generation
+
+
+async def aroom_summary_key(user_id, is_support):
+    if is_support:
+        return f'chat_rooms:{user_id}:support:{await _apool_generation()}'
+    return f'chat_rooms:{user_id}:customer'
+
+
+def get_room_summaries(user, build):
+    """
+    Return the cached room summaries for ``user``, calling ``build`` to
+    produce (and cache) them on a miss. ``build`` must return plain,
+    already-serialized data.
+    """
+    key = room_summary_key(user.id, is_support_user(user))
+    summaries = cache.get(key)
+    if summaries is None:
+        summaries = list(build())
+        cache.set(key, summaries, ROOM_SUMMARY_TTL)
+    return summaries
+
+
+async def aget_room_summaries(user, build):
+    """
+    Async ``get_room_summaries``; ``build`` is a coroutine function
+    """
+    key = await aroom_summary_key(user.id, is_support_user(user))
+    summaries = await cache.aget(key)
+    if summaries is None:
+        summaries = list(await build())
+        await cache.aset(key, summaries, ROOM_SUMMARY_TTL)
+    return summaries
+
+
+def invalidate_user_rooms(*user_ids):
+    """
+    Drop the cached room lists of the given users for both roles
+    """
+    keys = []
+    for user_id in user_ids:
+        if user_id is None:
+            continue
+        keys.append(room_summary_key(user_id, False))
+        keys.append(room_summary_key(user_id, True))
+    if keys:
+        cache.delete_many(keys)
+
+
+async def ainvalidate_user_rooms(*user_ids):
+    keys = []
+    for user_id in user_ids:
+        if user_id is None:
+            continue
+        keys.append(await aroom_summary_key(user_id, False))
+        keys.append(await aroom_summary_key(user_id, True))
+    if keys:
+        await cache.adelete_many(keys)
+
+
+def invalidate_support_pool():
+    """
+    Invalidate every support staff list by bumping the pool generation
+    """
+    try:
+        cache.incr(POOL_GENERATION_KEY)
+    except ValueError:
+        # Key missing (evicted or never set), start a fresh generation
+        cache.set(POOL_GENERATION_KEY, 1, None)
+
+
+def invalidate_room(room, previous_support_staff_id=None):
+    """
+    Invalidate every cached list that can contain ``room``
+    """
+    invalidate_user_rooms(room.user_id, room.support_staff_id, previous_support_staff_id)
+    # Unassigned rooms are visible to all support staff, as is the moment a
+    # room leaves the unassigned pool
+    if room.support_staff_id is None or previous_support_staff_id is None:
+        invalidate_support_pool()
@@ -0,0 +1,138 @@
+"""
+Full-text search over chat transcripts.
+
+Every new message is tokenized into ``ChatMessageTerm`` postings right after
+it is committed (see chat.signals). A query is answered from the postings
+alone: messages must contain every query term, can be narrowed by room,
+agent and date range, and are ranked by TF-IDF relevance or by time. Only
+the messages on the requested page are loaded from ``chat_chatmessage``.
+
+The number of messages used for the IDF weights is cached for
+``CHAT_SEARCH_COUNT_TTL`` seconds instead of counted on every query; the
+weights barely move as it drifts.
+"""
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, F, FloatField, Max, Sum, Value, When
+
+from .models import ChatMessage, ChatMessageTerm
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 64
+MIN_TERM_LENGTH = 2
+STOP_WORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in',
+    'is', 'it', 'of', 'on', 'or', 'so', 'the', 'to', 'was', 'we', 'you',
+})
+
+DOCUMENT_COUNT_KEY = 'chat:search:documents'
+DOCUMENT_COUNT_TTL = getattr(settings, 'CHAT_SEARCH_COUNT_TTL', 300)
+
+ORDER_RELEVANCE = 'relevance'
+ORDER_TIME = 'time'
+
+
+def tokenize(text):
+    """
+    Normalized search terms of ``text``, in order and with repeats
+    """
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(text.lower())
+        if len(token) >= MIN_TERM_LENGTH and token not in STOP_WORDS
+    ]
+
+
+def document_count():
+    """
+    Approximate number of messages in the index
+    """
+    return cache.get_or_set(DOCUMENT_COUNT_KEY, ChatMessage.objects.count, DOCUMENT_COUNT_TTL)
+
+
+def index_message(message):
+    """
+    Write the postings of a single message
+    """
+    frequencies = Counter(tokenize(message.message))
+    ChatMessageTerm.objects.bulk_create([
+        ChatMessageTerm(
+            term=term,
+            message_id=message.id,
+            room_id=message.room_id,
+            timestamp=message.timestamp,
+            frequency=min(count, 32767),
+        )
+        for term, count in frequencies.items()
+    ])
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Re-index every message from scratch. Returns the number indexed.
+    """
+    ChatMessageTerm.objects.all().delete()
+    indexed = 0
+    messages = ChatMessage.objects.only('id', 'room_id', 'message', 'timestamp').order_by('id')
+    for message in messages.iterator(chunk_size=batch_size):
+        index_message(message)
+        indexed += 1
+    cache.set(DOCUMENT_COUNT_KEY, indexed, DOCUMENT_COUNT_TTL)
+    return indexed
+
+
+def search(query, room=None, agent=None, date_from=None, date_to=None, order=ORDER_RELEVANCE):
+    """
+    Return a queryset of ``{'message', 'timestamp', 'score'}`` rows for
+    messages containing every term of ``query``, best (or newest) first.
+    ``room`` and ``agent`` may be instances or primary keys.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return ChatMessageTerm.objects.none().values('message')
+
+    postings = ChatMessageTerm.objects.filter(term__in=terms)
+    if room is not None:
+        postings = postings.filter(room=room)
+    if agent is not None:
+        postings = postings.filter(room__support_staff=agent)
+    if date_from is not None:
+        postings = postings.filter(timestamp__gte=date_from)
+    if date_to is not None:
+        postings = postings.filter(timestamp__lt=date_to)
+
+    # Inverse document frequency of each term over the whole index
+    total = max(document_count(), 1)
+    document_frequency = dict(
+        ChatMessageTerm.objects.filter(term__in=terms).values_list('term').annotate(df=Count('id'))
+    )
+    weights = [
+        When(term=term, then=F('frequency') * Value(math.log(1 + total / (1 + document_frequency.get(term, 0)))))
+        for term in terms
+    ]
+
+    matches = postings.values('message').annotate(
+        matched=Count('term', distinct=True),
+        score=Sum(Case(*weights, default=Value(0.0), output_field=FloatField())),
+        timestamp=Max('timestamp'),
+    ).filter(matched=len(terms))
+
+    if order == ORDER_TIME:
+        return matches.order_by('-timestamp', '-message')
+    return matches.order_by('-score', '-timestamp', '-message')
+
+
+def load_messages(rows):
+    """
+    Hydrate a page of search rows into ``(message, score)`` pairs, keeping
+    the ranking order
+    """
+    rows = list(rows)
+    messages = ChatMessage.objects.select_related(
+        'room', 'sender__support_profile'
+    ).in_bulk([row['message'] for row in rows])
+    return [(messages[row['message']], row['score']) for row in rows if row['message'] in messages]
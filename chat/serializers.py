@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import ChatRoom, ChatMessage, SupportStaff
+from .models import ChatRoom, ChatMessage, ChatReadCursor, SupportStaff
+from .pagination import message_history
 from django.contrib.auth.models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -31,14 +32,27 @@ class ChatMessageSerializer(serializers.ModelSerializer):
     """
     sender = UserSerializer(read_only=True)
     formatted_timestamp = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = ChatMessage
-        fields = ['id', 'room', 'sender', 'message', 'timestamp', 'formatted_timestamp', 'is_read']
-        read_only_fields = ['id', 'room', 'sender', 'timestamp', 'formatted_timestamp']
+        fields = ['id', 'room', 'sender', 'message', 'seq', 'timestamp', 'formatted_timestamp', 'is_read']
+        read_only_fields = ['id', 'room', 'sender', 'seq', 'timestamp', 'formatted_timestamp', 'is_read']
     
     def get_formatted_timestamp(self, obj):
         return obj.timestamp.strftime("%b %d, %Y %H:%M")
+    
+    def get_is_read(self, obj):
+        # Read once any participant other than the sender has read past it.
+        # Cursors are loaded once per room and shared through the context.
+        cursors = self.context.setdefault('read_cursors', {})
+        if obj.room_id not in cursors:
+            cursors[obj.room_id] = ChatReadCursor.cursors_for_room(obj.room_id)
+        return any(
+            read_seq >= obj.seq
+            for user_id, read_seq in cursors[obj.room_id].items()
+            if user_id != obj.sender_id
+        )
 
 class ChatRoomSerializer(serializers.ModelSerializer):
     """
@@ -57,9 +71,11 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     
     def get_last_message(self, obj):
         try:
-            message = obj.messages.order_by('-timestamp').first()
+            message = obj.messages.select_related(
+                'sender__support_profile'
+            ).order_by('-timestamp').first()
             if message:
-                return ChatMessageSerializer(message).data
+                return ChatMessageSerializer(message, context=self.context).data
             return None
         except ChatMessage.DoesNotExist:
             return None
@@ -67,14 +83,23 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     def get_unread_count(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.messages.filter(is_read=False).exclude(sender=request.user).count()
+            read_seq = getattr(obj, 'read_seq', None)
+            if read_seq is None:
+                read_seq = ChatReadCursor.objects.filter(
+                    room=obj, user=request.user
+                ).values_list('read_seq', flat=True).first() or 0
+            return max(obj.last_seq - read_seq, 0)
         return 0
 
 class ChatRoomWithMessagesSerializer(ChatRoomSerializer):
     """
-    Serializer for chat rooms with all messages
+    Serializer for chat rooms with the most recent page of messages.
+    Older messages are fetched through ``messages_cursor``.
     """
-    messages = ChatMessageSerializer(many=True, read_only=True)
     
-    class Meta(ChatRoomSerializer.Meta):
-        fields = ChatRoomSerializer.Meta.fields + ['messages'] 
\ No newline at end of file
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        messages, next_cursor = message_history(instance)
+        data['messages'] = ChatMessageSerializer(messages, many=True, context=self.context).data
+        data['messages_cursor'] = next_cursor
+        return data
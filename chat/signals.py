@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from . import codec, replay, search
+from .models import ChatRoom, ChatMessage
+from .room_cache import invalidate_room
+
+
+@receiver(post_init, sender=ChatRoom)
+def remember_support_staff(sender, instance, **kwargs):
+    # Keep the loaded assignment so saves can tell when a room changes hands
+    instance._loaded_support_staff_id = instance.support_staff_id
+
+
+@receiver(post_save, sender=ChatRoom)
+def room_saved(sender, instance, created, **kwargs):
+    previous_support_staff_id = None if created else instance._loaded_support_staff_id
+    instance._loaded_support_staff_id = instance.support_staff_id
+    transaction.on_commit(lambda: invalidate_room(instance, previous_support_staff_id))
+
+
+@receiver(post_delete, sender=ChatRoom)
+def room_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_room(instance, instance._loaded_support_staff_id))
+
+
+@receiver(post_save, sender=ChatMessage)
+def message_saved(sender, instance, created, **kwargs):
+    if created:
+        room = instance.room
+        transaction.on_commit(lambda: invalidate_room(room, room.support_staff_id))
+        transaction.on_commit(lambda: search.index_message(instance))
+        if instance.seq:
+            # Keep recent frames around for clients resuming after a disconnect
+            frame = codec.message_frame(instance)
+            transaction.on_commit(lambda: replay.remember(room.room_id, instance.seq, frame))
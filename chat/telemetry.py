@@ -0,0 +1,119 @@
+"""
+Connection telemetry for chat WebSockets.
+
+``ConnectionTelemetryMiddleware`` watches the ASGI messages of each socket
+and counts connects, accepts, rejects (by reason) and disconnects (by close
+code) in process. A sampled share of connections is also logged as one JSON
+record per event on the ``chat.telemetry`` logger. Records are only built
+when they are actually emitted, so unsampled connections cost a counter
+increment per event and nothing else.
+
+Consumers reject handshakes with the ``REJECT_*`` close codes below so the
+middleware can tell the reasons apart.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger('chat.telemetry')
+
+ENABLED = getattr(settings, 'CHAT_TELEMETRY_ENABLED', True)
+# Share of connections whose events are logged, between 0 and 1
+SAMPLE_RATE = getattr(settings, 'CHAT_TELEMETRY_SAMPLE_RATE', 0.01)
+SERVER_ID = getattr(settings, 'SERVER_ID', '')
+
+REJECT_MISSING_TOKEN = 4001
+REJECT_INVALID_TOKEN = 4002
+REJECT_FORBIDDEN = 4003
+REJECT_REASONS = {
+    REJECT_MISSING_TOKEN: 'missing_token',
+    REJECT_INVALID_TOKEN: 'invalid_token',
+    REJECT_FORBIDDEN: 'forbidden',
+}
+
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def incr(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def snapshot():
+    """
+    Return a copy of the counters, e.g. ``{'connect': 10, 'reject:forbidden': 1}``
+    """
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+class JsonRecord:
+    """
+    Log message serialized to JSON only if a handler formats it
+    """
+    __slots__ = ('fields',)
+
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, separators=(',', ':'), default=str)
+
+
+class ConnectionTelemetryMiddleware:
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope['type'] != 'websocket':
+            return await self.inner(scope, receive, send)
+
+        sampled = SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE and logger.isEnabledFor(logging.INFO)
+        started = time.monotonic()
+        accepted = False
+
+        def record(event, **fields):
+            if sampled:
+                logger.info(JsonRecord(
+                    event=event,
+                    server=SERVER_ID,
+                    path=scope.get('path'),
+                    ms=int((time.monotonic() - started) * 1000),
+                    **fields
+                ))
+
+        async def telemetry_receive():
+            message = await receive()
+            if message['type'] == 'websocket.connect':
+                incr('connect')
+                record('connect')
+            elif message['type'] == 'websocket.disconnect' and accepted:
+                code = message.get('code')
+                incr(f'disconnect:{code}')
+                record('disconnect', code=code)
+            return message
+
+        async def telemetry_send(message):
+            nonlocal accepted
+            if message['type'] == 'websocket.accept':
+                accepted = True
+                incr('accept')
+                record('accept')
+            elif message['type'] == 'websocket.close' and not accepted:
+                reason = REJECT_REASONS.get(message.get('code'), 'other')
+                incr(f'reject:{reason}')
+                record('reject', reason=reason)
+            return await send(message)
+
+        return await self.inner(scope, telemetry_receive, telemetry_send)
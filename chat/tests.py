@@ -1,3 +1,494 @@
-from django.test import TestCase
+import json
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import archive, assignment, codec, ratelimit, search, ws_auth
+from .consumers import SLOW_CONSUMER_CLOSE_CODE
+from .fast_serializers import aserialize_rooms, message_rows, serialize_messages, serialize_rooms
+from .layers import HashRing, ShardedRedisChannelLayer, host_identity
+from .models import ChatMessage, ChatReadCursor, ChatRoom, SupportStaff
+from .routing import websocket_urlpatterns
+from .serializers import ChatMessageSerializer, ChatRoomSerializer
+from .views import visible_rooms
+
+
+class HashRingTests(SimpleTestCase):
+    hosts = ['redis-1:6379/0', 'redis-2:6379/0', 'redis-3:6379/0', 'redis-4:6379/0']
+    keys = [f'chat_{room_id}' for room_id in range(2000)]
+
+    def test_removing_a_host_only_moves_its_keys(self):
+        before = HashRing(self.hosts)
+        remaining = self.hosts[:1] + self.hosts[2:]
+        after = HashRing(remaining)
+        for key in self.keys:
+            host = self.hosts[before.get_shard(key)]
+            if host != self.hosts[1]:
+                self.assertEqual(remaining[after.get_shard(key)], host, key)
+
+    def test_host_order_does_not_matter(self):
+        ring = HashRing(self.hosts)
+        reversed_hosts = self.hosts[::-1]
+        reversed_ring = HashRing(reversed_hosts)
+        for key in self.keys:
+            self.assertEqual(self.hosts[ring.get_shard(key)], reversed_hosts[reversed_ring.get_shard(key)])
+
+    def test_keys_spread_over_hosts(self):
+        ring = HashRing(self.hosts)
+        counts = [0] * len(self.hosts)
+        for key in self.keys:
+            counts[ring.get_shard(key)] += 1
+        self.assertTrue(all(count > len(self.keys) / len(self.hosts) / 2 for count in counts), counts)
+
+    def test_duplicate_hosts_are_rejected(self):
+        with self.assertRaises(ValueError):
+            HashRing(['redis-1:6379/0', 'redis-1:6379/0'])
+
+
+class HostIdentityTests(SimpleTestCase):
+    def test_credentials_are_not_part_of_the_identity(self):
+        self.assertEqual(host_identity({'address': 'redis://:secret@redis-1:6380/2'}), 'redis-1:6380/2')
+        self.assertEqual(host_identity({'address': 'redis://redis-1'}), 'redis-1:6379/0')
+
+    def test_explicit_name_wins(self):
+        self.assertEqual(host_identity({'address': 'redis://10.0.0.5:6379/0', 'name': 'shard-a'}), 'shard-a')
+
+    def test_layer_places_hosts_by_identity(self):
+        layer = ShardedRedisChannelLayer(hosts=['redis://redis-1:6379/0', 'redis://redis-2:6379/0'])
+        swapped = ShardedRedisChannelLayer(hosts=['redis://redis-2:6379/0', 'redis://redis-1:6379/0'])
+        for room_id in range(200):
+            group = f'chat_{room_id}'
+            self.assertEqual(
+                layer.hosts[layer.consistent_hash(group)]['address'],
+                swapped.hosts[swapped.consistent_hash(group)]['address'],
+            )
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerFlowControlTests(SimpleTestCase):
+    def setUp(self):
+        user = mock.Mock(id=1, username='alice')
+        for name, value in (
+            ('verify_token', mock.Mock(return_value={'user_id': user.id})),
+            ('ChatConsumer.get_user', mock.AsyncMock(return_value=user)),
+            ('ChatConsumer.check_room_access', mock.AsyncMock(return_value=True)),
+            ('ChatConsumer.get_room_roster', mock.AsyncMock(return_value={user.id: user.username})),
+            ('SEND_QUEUE_SIZE', 5),
+            ('ACK_WINDOW', 3),
+        ):
+            patcher = mock.patch(f'chat.consumers.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chat/room1/?token=t&ack=1')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        # Roster, then this user's own join
+        self.assertEqual((await communicator.receive_json_from())['t'], codec.ROSTER)
+        self.assertEqual((await communicator.receive_json_from())['t'], codec.USER_JOIN)
+        await communicator.send_json_to({'type': 'ack', 'n': 2})
+        return communicator
+
+    async def publish(self, seq):
+        frame = codec.chat_message_frame(seq, seq, 2, 'hello', timezone.now())
+        await get_channel_layer().group_send('chat_room1', codec.group_event('chat_message', frame))
+
+    async def test_client_that_stops_reading_is_disconnected(self):
+        communicator = await self.connect()
+        # Publish more than the window and queue can hold without reading
+        for seq in range(1, 10):
+            await self.publish(seq)
+        frames = []
+        while True:
+            output = await communicator.receive_output()
+            if output['type'] == 'websocket.close':
+                break
+            frames.append(json.loads(output['text']))
+        self.assertEqual(output['code'], SLOW_CONSUMER_CLOSE_CODE)
+        # Only the window went out before the resync request
+        self.assertEqual([frame['q'] for frame in frames[:-1]], [1, 2, 3])
+        self.assertEqual(frames[-1]['t'], codec.RESYNC)
+
+    async def test_client_that_acks_keeps_up(self):
+        communicator = await self.connect()
+        for seq in range(1, 21):
+            await self.publish(seq)
+            self.assertEqual((await communicator.receive_json_from())['q'], seq)
+            await communicator.send_json_to({'type': 'ack', 'n': seq + 2})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+
+class AssignmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer')
+        cls.room = ChatRoom.objects.create(name='Help', room_id='room-1', user=cls.customer)
+        cls.agents = [
+            SupportStaff.objects.create(user=User.objects.create_user(name), is_online=True)
+            for name in ('agent-a', 'agent-b')
+        ]
+
+    def counts(self):
+        return list(
+            SupportStaff.objects.filter(pk__in=[agent.pk for agent in self.agents])
+            .order_by('user__username').values_list('active_chat_count', flat=True)
+        )
+
+    def test_only_one_agent_wins_a_room(self):
+        # Both agents saw the room unassigned before either claimed it
+        first, second = ChatRoom.objects.get(pk=self.room.pk), ChatRoom.objects.get(pk=self.room.pk)
+        self.assertTrue(assignment.assign_room(first, self.agents[0]))
+        self.assertFalse(assignment.assign_room(second, self.agents[1]))
+        self.assertEqual(ChatRoom.objects.get(pk=self.room.pk).support_staff_id, self.agents[0].user_id)
+        # The loser's increment was rolled back with its failed claim
+        self.assertEqual(self.counts(), [1, 0])
+
+    def test_closing_twice_releases_capacity_once(self):
+        assignment.assign_room(self.room, self.agents[0])
+        stale = ChatRoom.objects.get(pk=self.room.pk)
+        self.assertTrue(assignment.close_room(self.room))
+        self.assertFalse(assignment.close_room(stale))
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_counter_never_goes_negative(self):
+        assignment.assign_room(self.room, self.agents[0])
+        # Drifted low, e.g. after an edit in the admin
+        SupportStaff.objects.filter(pk=self.agents[0].pk).update(active_chat_count=0)
+        self.assertTrue(assignment.close_room(self.room))
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_rebuild_repairs_drifted_counters(self):
+        assignment.assign_room(self.room, self.agents[0])
+        SupportStaff.objects.filter(pk=self.agents[0].pk).update(active_chat_count=0)
+        SupportStaff.objects.filter(pk=self.agents[1].pk).update(active_chat_count=2)
+        self.assertEqual(assignment.rebuild_active_chat_counts(), 2)
+        self.assertEqual(self.counts(), [1, 0])
+        self.assertEqual(assignment.rebuild_active_chat_counts(), 0)
+
+
+class WebSocketTokenTests(SimpleTestCase):
+    def setUp(self):
+        ws_auth.clear_cache()
+        self.addCleanup(ws_auth.clear_cache)
+
+    def token(self, key=None, token_type='access', lifetime=60):
+        claims = {
+            ws_auth.JWT_SETTINGS['TOKEN_TYPE_CLAIM']: token_type,
+            ws_auth.JWT_SETTINGS['USER_ID_CLAIM']: 7,
+            'exp': int(time.time()) + lifetime,
+        }
+        return jwt.encode(claims, key or ws_auth.JWT_SETTINGS['SIGNING_KEY'], algorithm=ws_auth.JWT_SETTINGS['ALGORITHM'])
+
+    def test_access_token_is_accepted(self):
+        claims = ws_auth.verify_token(self.token())
+        self.assertEqual(claims[ws_auth.JWT_SETTINGS['USER_ID_CLAIM']], 7)
+
+    def test_refresh_token_is_rejected(self):
+        with self.assertRaises(jwt.InvalidTokenError):
+            ws_auth.verify_token(self.token(token_type='refresh'))
+
+    def test_expired_token_is_rejected(self):
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            ws_auth.verify_token(self.token(lifetime=-1))
+
+    def test_token_signed_with_previous_key_is_accepted_during_rotation(self):
+        with mock.patch.object(ws_auth, 'PREVIOUS_SIGNING_KEYS', ['retired-key']):
+            self.assertTrue(ws_auth.verify_token(self.token(key='retired-key')))
+            with self.assertRaises(jwt.InvalidSignatureError):
+                ws_auth.verify_token(self.token(key='unknown-key'))
+
+    def test_cached_claims_expire_with_the_token(self):
+        token = self.token(lifetime=60)
+        self.now = time.time()
+        with (
+            mock.patch.object(ws_auth, 'time', mock.Mock(time=lambda: self.now)),
+            mock.patch.object(ws_auth, '_decode', wraps=ws_auth._decode) as decode,
+        ):
+            ws_auth.verify_token(token)
+            self.now += 30
+            ws_auth.verify_token(token)
+            self.assertEqual(decode.call_count, 1)
+            # Past exp the cached claims are dropped and the token checked again
+            self.now += 60
+            ws_auth.verify_token(token)
+            self.assertEqual(decode.call_count, 2)
+
+
+class FastSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer')
+        agent = User.objects.create_user('agent')
+        SupportStaff.objects.create(user=agent)
+        assigned = ChatRoom.objects.create(name='Order', room_id='room-1', user=cls.customer, support_staff=agent)
+        assigned.append_message(cls.customer, 'Where is my order?')
+        assigned.append_message(agent, 'On its way')
+        # Waiting for an agent
+        unassigned = ChatRoom.objects.create(name='Refund', room_id='room-2', user=cls.customer)
+        unassigned.append_message(cls.customer, 'Hello?')
+        ChatRoom.objects.create(name='Empty', room_id='room-3', user=cls.customer)
+        # Distinct timestamps, so both serializers agree on each room's last message
+        for minutes, message in enumerate(ChatMessage.objects.order_by('id')):
+            ChatMessage.objects.filter(pk=message.pk).update(timestamp=message.timestamp + timedelta(minutes=minutes))
+
+    def rooms(self):
+        return visible_rooms(self.customer)
+
+    def context(self):
+        request = RequestFactory().get('/')
+        request.user = self.customer
+        return {'request': request}
+
+    def test_rooms_match_room_serializer(self):
+        expected = ChatRoomSerializer(self.rooms(), many=True, context=self.context()).data
+        self.assertEqual(serialize_rooms(self.rooms()), expected)
+        by_id = {room['room_id']: room for room in expected}
+        self.assertIsNone(by_id['room-2']['support_staff'])
+        self.assertIsNone(by_id['room-3']['last_message'])
+
+    async def test_async_rooms_match_room_serializer(self):
+        expected = await sync_to_async(
+            lambda: ChatRoomSerializer(self.rooms(), many=True, context=self.context()).data
+        )()
+        self.assertEqual(await aserialize_rooms(self.rooms()), expected)
+
+    def test_messages_match_message_serializer(self):
+        messages = ChatMessage.objects.order_by('room_id', 'seq')
+        expected = ChatMessageSerializer(
+            messages.select_related('sender__support_profile'), many=True, context=self.context()
+        ).data
+        self.assertEqual(serialize_messages(message_rows(messages)), expected)
+        self.assertEqual([message['is_read'] for message in expected], [True, False, False])
+
+
+class ChatReadCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer')
+        cls.room = ChatRoom.objects.create(name='Help', room_id='room-1', user=cls.user)
+
+    def read_seq(self):
+        return ChatReadCursor.objects.get(room=self.room, user=self.user).read_seq
+
+    def test_first_read_creates_cursor(self):
+        ChatReadCursor.mark_read(self.room, self.user, 3)
+        self.assertEqual(self.read_seq(), 3)
+
+    def test_cursor_moves_forward(self):
+        ChatReadCursor.mark_read(self.room, self.user, 1)
+        ChatReadCursor.mark_read(self.room, self.user, 4)
+        self.assertEqual(self.read_seq(), 4)
+
+    def test_cursor_never_regresses(self):
+        ChatReadCursor.mark_read(self.room, self.user, 1)
+        ChatReadCursor.mark_read(self.room, self.user, 0)
+        self.assertEqual(self.read_seq(), 1)
+
+    def test_stale_room_does_not_undo_newer_read(self):
+        stale_room = ChatRoom.objects.get(pk=self.room.pk)
+        self.room.append_message(self.user, 'first')
+        self.room.append_message(self.user, 'second')
+        ChatReadCursor.mark_read(stale_room, self.user)
+        self.assertEqual(self.read_seq(), 2)
+        self.assertEqual(ChatReadCursor.objects.filter(room=self.room, user=self.user).count(), 1)
+
+    async def test_async_mark_read_never_regresses(self):
+        await ChatReadCursor.amark_read(self.room, self.user, 5)
+        await ChatReadCursor.amark_read(self.room, self.user, 2)
+        cursor = await ChatReadCursor.objects.aget(room=self.room, user=self.user)
+        self.assertEqual(cursor.read_seq, 5)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        patcher = mock.patch.object(archive, 'ARCHIVE_ROOT', Path(root.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('customer')
+        self.room = ChatRoom.objects.create(name='Help', room_id='room-1', user=self.user)
+
+    def close(self, days_ago=40):
+        ChatRoom.objects.filter(pk=self.room.pk).update(
+            is_active=False, updated_at=timezone.now() - timedelta(days=days_ago),
+        )
+
+    def test_only_old_closed_rooms_with_messages_are_due(self):
+        self.close()
+        self.assertFalse(archive.rooms_due(30).exists())
+        self.room.append_message(self.user, 'hello')
+        self.close(days_ago=10)
+        self.assertFalse(archive.rooms_due(30).exists())
+        self.close()
+        self.assertEqual(list(archive.rooms_due(30)), [self.room])
+
+    def test_reopened_room_is_archived_again(self):
+        self.room.append_message(self.user, 'first')
+        self.close()
+        self.assertEqual(archive.archive_room(self.room), 1)
+        self.assertFalse(archive.rooms_due(30).exists())
+
+        ChatRoom.objects.filter(pk=self.room.pk).update(is_active=True)
+        self.room.append_message(self.user, 'second')
+        self.close()
+        self.assertEqual(list(archive.rooms_due(30)), [self.room])
+        self.assertEqual(archive.archive_room(self.room), 1)
+        self.assertFalse(ChatMessage.objects.filter(room=self.room).exists())
+        self.assertEqual([record['message'] for record in archive.read_archive(self.room)], ['first', 'second'])
+
+    def test_earlier_archive_is_streamed_not_loaded(self):
+        self.room.append_message(self.user, 'first')
+        archive.archive_room(self.room)
+        self.room.append_message(self.user, 'second')
+        with mock.patch.object(archive, 'read_archive', side_effect=AssertionError('loaded whole archive')):
+            self.assertEqual(archive.archive_room(self.room), 1)
+        self.assertEqual([record['seq'] for record in archive.read_archive(self.room)], [1, 2])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user('customer')
+        self.agent = User.objects.create_user('agent')
+        SupportStaff.objects.create(user=self.agent)
+        self.room = ChatRoom.objects.create(name='Help', room_id='room-1', user=self.customer, support_staff=self.agent)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.append_message(self.customer, 'my parcel is late')
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_document_count_is_cached(self):
+        self.assertEqual(search.document_count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.append_message(self.customer, 'still late')
+        with self.assertNumQueries(0):
+            self.assertEqual(search.document_count(), 1)
+        search.rebuild_index()
+        self.assertEqual(search.document_count(), 2)
+
+    def test_search_by_agent(self):
+        response = self.client.get(reverse('chatmessage-search'), {'q': 'parcel', 'agent': self.agent.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_invalid_agent_is_rejected(self):
+        response = self.client.get(reverse('chatmessage-search'), {'q': 'parcel', 'agent': 'someone'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_admin_search_by_text_or_sender_prefix(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.append_message(self.agent, 'sorry about that')
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+        def search(term):
+            response = self.client.get(reverse('admin:chat_chatmessage_changelist'), {'q': term})
+            self.assertEqual(response.status_code, 200)
+            return sorted(message.message for message in response.context['cl'].result_list)
+
+        self.assertEqual(search('parcel'), ['my parcel is late'])
+        self.assertEqual(search('AGE'), ['sorry about that'])
+        self.assertEqual(search('ustomer'), [])
+
+
+class LocalRateLimitTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch.object(ratelimit, 'time', mock.Mock(monotonic=lambda: self.now))
+        clock.start()
+        self.addCleanup(clock.stop)
+        ratelimit._local_buckets.clear()
+        self.addCleanup(ratelimit._local_buckets.clear)
+        redis_state = mock.patch.object(ratelimit, '_redis_down_until', None)
+        redis_state.start()
+        self.addCleanup(redis_state.stop)
+
+    def bucket(self, rate=1.0, burst=3, cost=1, reserve=0, key='chat_rl:user:1'):
+        return [(key, rate, burst, cost, reserve)]
+
+    def test_burst_then_wait(self):
+        for _ in range(3):
+            self.assertEqual(ratelimit._check_local(self.bucket()), 0)
+        self.assertEqual(ratelimit._check_local(self.bucket()), 1.0)
+
+    def test_tokens_refill_at_rate_up_to_burst(self):
+        for _ in range(3):
+            ratelimit._check_local(self.bucket())
+        self.now += 0.5
+        self.assertAlmostEqual(ratelimit._check_local(self.bucket()), 0.5)
+        self.now += 0.5
+        self.assertEqual(ratelimit._check_local(self.bucket()), 0)
+        self.now += 60
+        for _ in range(3):
+            self.assertEqual(ratelimit._check_local(self.bucket()), 0)
+        self.assertGreater(ratelimit._check_local(self.bucket()), 0)
+
+    def test_refused_frame_takes_nothing_from_any_bucket(self):
+        user = self.bucket(burst=5)
+        room = self.bucket(burst=1, key='chat_rl:room:1')
+        self.assertEqual(ratelimit._check_local(user + room), 0)
+        self.assertGreater(ratelimit._check_local(user + room), 0)
+        self.assertEqual(ratelimit._local_buckets['chat_rl:user:1'][0], 4)
+
+    def test_typing_is_shed_before_messages(self):
+        with mock.patch.multiple(ratelimit, USER_BURST=10, ROOM_BURST=30, TYPING_COST=0.2, TYPING_RESERVE=0.5):
+            for _ in range(5):
+                self.assertEqual(ratelimit._check_local(ratelimit._buckets(ratelimit.MESSAGE, 1, 1)), 0)
+            # Half the user bucket is left, which typing may not touch
+            self.assertGreater(ratelimit._check_local(ratelimit._buckets(ratelimit.TYPING, 1, 1)), 0)
+            self.assertEqual(ratelimit._check_local(ratelimit._buckets(ratelimit.MESSAGE, 1, 1)), 0)
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        with mock.patch.object(ratelimit, 'LOCAL_BUCKETS_MAX', 2):
+            for user_id in range(3):
+                ratelimit._check_local(self.bucket(key=f'chat_rl:user:{user_id}'))
+        self.assertEqual(list(ratelimit._local_buckets), ['chat_rl:user:1', 'chat_rl:user:2'])
+
+    def test_check_falls_back_to_local_buckets(self):
+        with mock.patch.object(ratelimit, '_check_redis', side_effect=ConnectionError('down')):
+            with self.assertLogs('django.channels', 'WARNING'):
+                self.assertEqual(ratelimit.check(ratelimit.MESSAGE, 1, 1), 0)
+        self.assertIn('chat_rl:user:1', ratelimit._local_buckets)
+
+    def test_redis_outage_is_remembered_and_logged_once(self):
+        with (
+            mock.patch.object(ratelimit, 'REDIS_RETRY_INTERVAL', 5),
+            mock.patch.object(ratelimit, '_check_redis', side_effect=ConnectionError('down')) as check_redis,
+            self.assertLogs('django.channels', 'INFO') as logs,
+        ):
+            for _ in range(3):
+                ratelimit.check(ratelimit.MESSAGE, 1, 1)
+            # Later frames skip Redis until the retry interval has passed
+            self.assertEqual(check_redis.call_count, 1)
+            self.now += 5
+            ratelimit.check(ratelimit.MESSAGE, 1, 1)
+            self.assertEqual(check_redis.call_count, 2)
+            self.now += 5
+            check_redis.side_effect = None
+            check_redis.return_value = 0
+            ratelimit.check(ratelimit.MESSAGE, 1, 1)
+            ratelimit.check(ratelimit.MESSAGE, 1, 1)
+            self.assertEqual(check_redis.call_count, 4)
+        self.assertEqual(
+            [record.getMessage() for record in logs.records],
+            ["Rate limiter falling back to local buckets: down", "Rate limiter using Redis again"],
+        )
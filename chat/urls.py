@@ -1,7 +1,7 @@
 from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from . import views, consumers
+from . import views, consumers, async_views
 
 # Set up the router for API views
 router = DefaultRouter()
@@ -16,6 +16,9 @@ urlpatterns = [
     path('room/<str:room_id>/', views.chat_room, name='chat_room'),
     
     # API endpoints
+    path('api/async/rooms/', async_views.room_list, name='async_room_list'),
+    path('api/async/messages/', async_views.message_list, name='async_message_list'),
+    path('api/async/messages/mark_read/', async_views.mark_read, name='async_mark_read'),
     path('api/', include(router.urls)),
     
     # JWT Token endpoints
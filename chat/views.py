@@ -1,25 +1,36 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Q
+from django.http import JsonResponse, HttpResponse, Http404
+from django.db.models import Q, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from datetime import datetime, time
+from django.core.paginator import Paginator
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 import uuid
 import logging
-from django.core.cache import cache
 from django.conf import settings
 
 # REST Framework imports
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
 # JWT Token imports
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.tokens import RefreshToken
+
+from ecommerce.db.routers import replica_reads
 
 # Models and serializers
-from .models import ChatRoom, ChatMessage, SupportStaff
+from .models import ChatRoom, ChatMessage, ChatReadCursor, SupportStaff
+from .assignment import assign_room, auto_assign, assign_waiting_rooms, close_room
+from .pagination import message_history, MESSAGE_PAGE_SIZE, MAX_MESSAGE_PAGE_SIZE
+from .room_cache import get_room_summaries, invalidate_user_rooms
+from .fast_serializers import MESSAGE_VALUES, message_rows, serialize_messages, serialize_rooms
+from . import ratelimit, search as chat_search
+from .ws_auth import session_ws_token
 from .serializers import (
     ChatRoomSerializer, 
     ChatRoomWithMessagesSerializer,
@@ -34,14 +45,6 @@ logger = logging.getLogger('django.channels')
 # Cache time in seconds
 CACHE_TTL = getattr(settings, 'CACHE_TIMEOUT', 900)  # 15 minutes default
 
-# Generate tokens for WebSocket authentication
-def get_tokens_for_user(user):
-    refresh = RefreshToken.for_user(user)
-    return {
-        'refresh': str(refresh),
-        'access': str(refresh.access_token),
-    }
-
 # Template Views
 @login_required
 def chat_home(request):
@@ -65,13 +68,13 @@ def chat_home(request):
     if request.user.is_staff and not hasattr(request.user, 'support_profile'):
         SupportStaff.objects.create(user=request.user)
     
-    # Generate JWT token for WebSocket authentication
-    tokens = get_tokens_for_user(request.user)
+    # JWT for WebSocket authentication, reused across page renders
+    ws_token = session_ws_token(request)
     
     context = {
         'chat_rooms': chat_rooms,
         'is_support': hasattr(request.user, 'support_profile'),
-        'ws_token': tokens['access'],
+        'ws_token': ws_token,
     }
     return render(request, 'chat/chat_home.html', context)
 
@@ -89,26 +92,26 @@ def chat_room(request, room_id):
     
     # Assign support staff if not assigned and current user is support
     if hasattr(request.user, 'support_profile') and room.support_staff is None:
-        room.support_staff = request.user
-        room.save()
+        assign_room(room, request.user.support_profile, enforce_capacity=False)
     
-    # Mark messages as read
-    ChatMessage.objects.filter(
-        room=room,
-        is_read=False
-    ).exclude(sender=request.user).update(is_read=True)
+    # Mark messages as read by moving the user's read cursor
+    ChatReadCursor.mark_read(room, request.user)
+    invalidate_user_rooms(request.user.id)
     
-    # Get messages
-    messages = ChatMessage.objects.filter(room=room).order_by('timestamp')
+    # Get only the most recent page of messages, older ones load on demand
+    messages, messages_cursor = message_history(room)
+    last_seq = messages[-1].seq if messages else 0
     
-    # Generate JWT token for WebSocket authentication
-    tokens = get_tokens_for_user(request.user)
+    # JWT for WebSocket authentication, reused across page renders
+    ws_token = session_ws_token(request)
     
     context = {
         'room': room,
         'messages': messages,
+        'messages_cursor': messages_cursor,
+        'last_seq': last_seq,
         'is_support': hasattr(request.user, 'support_profile'),
-        'ws_token': tokens['access'],
+        'ws_token': ws_token,
     }
     return render(request, 'chat/chat_room.html', context)
 
@@ -120,6 +123,46 @@ def websocket_view(request, room_id):
     logger.debug(f"WebSocket view called for room: {room_id}")
     return HttpResponse("WebSocket endpoint - Connect using WebSocket protocol, not HTTP.")
 
+def visible_rooms(user):
+    """
+    Active rooms ``user`` may see, annotated with their read cursor
+    """
+    if hasattr(user, 'support_profile'):
+        # Support staff can see all active rooms and rooms assigned to them
+        queryset = ChatRoom.objects.filter(
+            Q(support_staff=user) | Q(support_staff__isnull=True),
+            is_active=True
+        )
+    else:
+        # Regular users can only see their own rooms
+        queryset = ChatRoom.objects.filter(
+            user=user,
+            is_active=True
+        )
+    # Join in the user's read cursor so unread counts need no extra query
+    read_seq = ChatReadCursor.objects.filter(
+        room=OuterRef('pk'),
+        user=user
+    ).values('read_seq')[:1]
+    return queryset.annotate(
+        read_seq=Coalesce(Subquery(read_seq), 0)
+    ).order_by('-updated_at')
+
+def visible_messages(user):
+    """
+    Messages ``user`` may see, oldest first
+    """
+    if hasattr(user, 'support_profile'):
+        # Support staff can see messages in rooms they're assigned to or unassigned
+        return ChatMessage.objects.filter(
+            Q(room__support_staff=user) | 
+            (Q(room__support_staff__isnull=True) & Q(room__is_active=True))
+        ).select_related('sender__support_profile').order_by('timestamp')
+    # Regular users can only see messages in their own rooms
+    return ChatMessage.objects.filter(
+        room__user=user
+    ).select_related('sender__support_profile').order_by('timestamp')
+
 # API Views
 class ChatRoomViewSet(viewsets.ModelViewSet):
     """
@@ -136,36 +179,65 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         return ChatRoomSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        cache_key = f'chat_rooms:{user.id}:{user.is_staff}'
-        
-        # Try to get from cache first
-        queryset = cache.get(cache_key)
-        if queryset is not None:
-            return queryset
-            
-        # If not in cache, fetch from database
-        if hasattr(user, 'support_profile'):
-            # Support staff can see all active rooms and rooms assigned to them
-            queryset = ChatRoom.objects.filter(
-                Q(support_staff=user) | Q(support_staff__isnull=True),
-                is_active=True
-            ).order_by('-updated_at')
-        else:
-            # Regular users can only see their own rooms
-            queryset = ChatRoom.objects.filter(
-                user=user,
-                is_active=True
-            ).order_by('-updated_at')
-            
-        # Store in cache for future requests
-        cache.set(cache_key, queryset, CACHE_TTL // 2)  # Shorter TTL for dynamic data
-        return queryset
+        # Always a fresh lookup so object-level actions see new and updated rooms
+        return visible_rooms(self.request.user)
+    
+    def list(self, request, *args, **kwargs):
+        # Serve the materialized room summaries, invalidated by chat.signals
+        summaries = get_room_summaries(
+            request.user,
+            lambda: serialize_rooms(self.get_queryset())
+        )
+        return Response(summaries)
+    
+    @replica_reads
+    def retrieve(self, request, *args, **kwargs):
+        # Same payload as ChatRoomWithMessagesSerializer, built from value rows
+        rooms = serialize_rooms(self.get_queryset().filter(room_id=kwargs[self.lookup_field]))
+        if not rooms:
+            raise Http404
+        data = rooms[0]
+        messages, next_cursor = message_history(data['id'], values=MESSAGE_VALUES)
+        data['messages'] = serialize_messages(messages)
+        data['messages_cursor'] = next_cursor
+        return Response(data)
     
     def perform_create(self, serializer):
         # Generate a unique room ID and assign the current user
         room_id = str(uuid.uuid4())[:8]
-        serializer.save(user=self.request.user, room_id=room_id)
+        room = serializer.save(user=self.request.user, room_id=room_id)
+        # Route the new room to the least loaded available agent
+        auto_assign(room)
+    
+    @action(detail=True, methods=['get'])
+    @replica_reads
+    def history(self, request, room_id=None):
+        """
+        Fetch a page of messages older than the ``before`` cursor
+        """
+        room = self.get_object()
+        try:
+            limit = min(int(request.query_params.get('limit', MESSAGE_PAGE_SIZE)), MAX_MESSAGE_PAGE_SIZE)
+        except ValueError:
+            limit = MESSAGE_PAGE_SIZE
+        
+        try:
+            messages, next_cursor = message_history(
+                room,
+                before=request.query_params.get('before'),
+                limit=max(limit, 1),
+                values=MESSAGE_VALUES
+            )
+        except ValueError:
+            return Response(
+                {'error': 'Invalid cursor'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'results': serialize_messages(messages),
+            'next_cursor': next_cursor,
+        })
     
     @action(detail=True, methods=['post'])
     def close(self, request, room_id=None):
@@ -173,8 +245,7 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         Close a chat room
         """
         room = self.get_object()
-        room.is_active = False
-        room.save()
+        close_room(room)
         return Response({'status': 'chat closed'})
     
     @action(detail=True, methods=['post'])
@@ -195,8 +266,11 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        room.support_staff = request.user
-        room.save()
+        if room.support_staff is None and not assign_room(room, request.user.support_profile, enforce_capacity=False):
+            return Response(
+                {'error': 'Room already has an assigned support staff'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         return Response({'status': 'assigned to room'})
 
 class ChatMessageViewSet(viewsets.ModelViewSet):
@@ -208,18 +282,11 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        user = self.request.user
-        # Filter messages based on user's role
-        if hasattr(user, 'support_profile'):
-            # Support staff can see messages in rooms they're assigned to or unassigned
-            return ChatMessage.objects.filter(
-                Q(room__support_staff=user) | 
-                (Q(room__support_staff__isnull=True) & Q(room__is_active=True))
-            ).order_by('timestamp')
-        # Regular users can only see messages in their own rooms
-        return ChatMessage.objects.filter(
-            room__user=user
-        ).order_by('timestamp')
+        return visible_messages(self.request.user)
+    
+    @replica_reads
+    def list(self, request, *args, **kwargs):
+        return Response(serialize_messages(message_rows(self.filter_queryset(self.get_queryset()))))
     
     def perform_create(self, serializer):
         # Get the room ID from the request
@@ -234,12 +301,17 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Update the room's updated_at timestamp
-        room.updated_at = timezone.now()
-        room.save()
+        # Same flood control as WebSocket messages
+        retry_after = ratelimit.check(ratelimit.MESSAGE, self.request.user.id, room.room_id)
+        if retry_after:
+            raise Throttled(wait=retry_after)
         
-        # Create the message
-        serializer.save(room=room, sender=self.request.user)
+        # Create the message with the room's next sequence number, which
+        # also updates the room's updated_at timestamp
+        serializer.instance = room.append_message(
+            self.request.user,
+            serializer.validated_data['message']
+        )
     
     @action(detail=False, methods=['post'])
     def mark_read(self, request):
@@ -254,13 +326,93 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             )
         
         room = get_object_or_404(ChatRoom, room_id=room_id)
-        # Mark all messages not sent by the current user as read
-        ChatMessage.objects.filter(
-            room=room,
-            is_read=False
-        ).exclude(sender=request.user).update(is_read=True)
+        # Mark everything up to the room's latest message as read
+        ChatReadCursor.mark_read(room, request.user)
+        # Refresh the reader's cached unread counts
+        invalidate_user_rooms(request.user.id)
         
         return Response({'status': 'messages marked as read'})
+    
+    @action(detail=False, methods=['get'])
+    @replica_reads
+    def search(self, request):
+        """
+        Full-text search across chat transcripts (support staff only)
+        """
+        if not hasattr(request.user, 'support_profile'):
+            return Response(
+                {'error': 'Only support staff can search transcripts'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'Search query is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        bounds = {}
+        for param in ('date_from', 'date_to'):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            parsed = parse_datetime(value) or parse_date(value)
+            if parsed is None:
+                return Response(
+                    {'error': f'Invalid {param}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if not hasattr(parsed, 'hour'):
+                parsed = timezone.make_aware(datetime.combine(parsed, time.min))
+            elif timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            bounds[param] = parsed
+        
+        room_id = request.query_params.get('room')
+        agent = request.query_params.get('agent') or None
+        if agent is not None:
+            try:
+                agent = int(agent)
+            except ValueError:
+                return Response(
+                    {'error': 'agent must be a user id'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        order = request.query_params.get('order', chat_search.ORDER_RELEVANCE)
+        if order not in (chat_search.ORDER_RELEVANCE, chat_search.ORDER_TIME):
+            return Response(
+                {'error': 'order must be "relevance" or "time"'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rows = chat_search.search(
+            query,
+            room=get_object_or_404(ChatRoom, room_id=room_id) if room_id else None,
+            agent=agent,
+            order=order,
+            **bounds
+        )
+        try:
+            limit = min(int(request.query_params.get('limit', MESSAGE_PAGE_SIZE)), MAX_MESSAGE_PAGE_SIZE)
+        except ValueError:
+            limit = MESSAGE_PAGE_SIZE
+        paginator = Paginator(rows, max(limit, 1))
+        page = paginator.get_page(request.query_params.get('page'))
+        
+        results = []
+        for message, score in chat_search.load_messages(page.object_list):
+            data = ChatMessageSerializer(message, context={'request': request}).data
+            data['room_id'] = message.room.room_id
+            data['score'] = round(score, 4)
+            results.append(data)
+        
+        return Response({
+            'count': paginator.count,
+            'page': page.number,
+            'num_pages': paginator.num_pages,
+            'results': results,
+        })
 
 class SupportStaffViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -292,4 +444,9 @@ class SupportStaffViewSet(viewsets.ReadOnlyModelViewSet):
             staff.is_available = is_available
         
         staff.save()
+        
+        # Pick up waiting rooms as soon as the agent becomes available
+        if staff.is_online and staff.is_available:
+            assign_waiting_rooms(staff)
+            staff.refresh_from_db(fields=['active_chat_count'])
         return Response(SupportStaffSerializer(staff).data)
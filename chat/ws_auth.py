@@ -0,0 +1,106 @@
+"""
+JWT authentication for chat WebSockets.
+
+Tokens arrive in the ``token`` query parameter. Verified claims are kept in
+a bounded per-process LRU until the token expires, so reconnect storms do
+not re-run signature checks for tokens already seen. Tokens signed with the
+current ``SIMPLE_JWT['SIGNING_KEY']`` or any of ``CHAT_JWT_PREVIOUS_SIGNING_KEYS``
+are accepted, which lets the key be rotated without disconnecting everyone.
+
+Pages hand out the access token through ``session_ws_token``, which reuses
+one short-lived token per session instead of minting a refresh/access pair
+on every render.
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+import jwt
+from django.conf import settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+JWT_SETTINGS = settings.SIMPLE_JWT
+PREVIOUS_SIGNING_KEYS = getattr(settings, 'CHAT_JWT_PREVIOUS_SIGNING_KEYS', [])
+TOKEN_CACHE_SIZE = getattr(settings, 'CHAT_WS_TOKEN_CACHE_SIZE', 4096)
+# A session's token is replaced once less than this many seconds remain
+TOKEN_MIN_REMAINING = getattr(settings, 'CHAT_WS_TOKEN_MIN_REMAINING', 10 * 60)
+
+SESSION_TOKEN_KEY = 'chat_ws_token'
+
+_claims_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def parse_query(scope):
+    """
+    First value of every query-string parameter of an ASGI scope
+    """
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return {name: values[0] for name, values in query.items()}
+
+
+def signing_keys():
+    return [JWT_SETTINGS['SIGNING_KEY'], *PREVIOUS_SIGNING_KEYS]
+
+
+def _decode(token):
+    algorithm = JWT_SETTINGS['ALGORITHM']
+    error = None
+    for key in signing_keys():
+        try:
+            claims = jwt.decode(token, key, algorithms=[algorithm])
+        except jwt.InvalidSignatureError as exc:
+            # Possibly signed with another key of the rotation
+            error = exc
+            continue
+        if claims.get(JWT_SETTINGS['TOKEN_TYPE_CLAIM']) != AccessToken.token_type:
+            raise jwt.InvalidTokenError('Not an access token')
+        return claims
+    raise error
+
+
+def verify_token(token):
+    """
+    Return the claims of a valid access token, raising ``jwt.PyJWTError``
+    otherwise
+    """
+    now = time.time()
+    with _cache_lock:
+        cached = _claims_cache.get(token)
+        if cached is not None:
+            if cached.get('exp', 0) > now:
+                _claims_cache.move_to_end(token)
+                return cached
+            del _claims_cache[token]
+
+    claims = _decode(token)
+    with _cache_lock:
+        _claims_cache[token] = claims
+        while len(_claims_cache) > TOKEN_CACHE_SIZE:
+            _claims_cache.popitem(last=False)
+    return claims
+
+
+def clear_cache():
+    with _cache_lock:
+        _claims_cache.clear()
+
+
+def session_ws_token(request):
+    """
+    Access token for the page's WebSocket, reused for the whole session until
+    it gets close to expiry
+    """
+    stored = request.session.get(SESSION_TOKEN_KEY)
+    if (stored and stored['user_id'] == request.user.pk and
+            stored['exp'] - time.time() > TOKEN_MIN_REMAINING):
+        return stored['token']
+
+    token = AccessToken.for_user(request.user)
+    request.session[SESSION_TOKEN_KEY] = {
+        'token': str(token),
+        'user_id': request.user.pk,
+        'exp': token['exp'],
+    }
+    return str(token)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class EcommerceConfig(AppConfig):
+    name = 'ecommerce'
+
+    def ready(self):
+        # Register the production profile checks
+        from . import checks  # noqa: F401
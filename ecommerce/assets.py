@@ -0,0 +1,220 @@
+"""
+Frontend asset bundling.
+
+The vendored Bootstrap and Font Awesome files and the site's own CSS/JS are
+concatenated into one stylesheet and one script under ``static/dist/``:
+
+    python manage.py build_assets
+
+Relative ``url()`` references are rewritten for the bundle's location, the
+site's own sources are minified, and the rules the page shell needs for
+first paint are extracted into ``dist/critical.css``. Those are the rules
+whose classes all appear in the shell templates (the navbar, footer and
+layout of ``base.html`` and its partials), and they are inlined by ``{% critical_css %}``.
+``collectstatic`` then fingerprints the bundles and WhiteNoise writes their
+gzip and brotli variants.
+
+This module has no Django imports so the build can also run on its own.
+"""
+import os
+import posixpath
+import re
+
+BUNDLES = {
+    'dist/site.css': [
+        'vendor/bootstrap-5.3.0/css/bootstrap.min.css',
+        'vendor/fontawesome-free-6.0.0/css/all.min.css',
+        'css/style.css',
+    ],
+    'dist/site.js': [
+        'vendor/bootstrap-5.3.0/js/popper.min.js',
+        'vendor/bootstrap-5.3.0/js/bootstrap.min.js',
+        'js/main.js',
+    ],
+}
+CRITICAL_SOURCE = 'dist/site.css'
+CRITICAL_OUTPUT = 'dist/critical.css'
+CRITICAL_TEMPLATES = ['base.html', 'partials/user_nav.html', 'partials/messages.html', 'partials/chat_button.html']
+
+URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+CLASS_ATTR_RE = re.compile(r'class="([^"]*)"')
+SELECTOR_CLASS_RE = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+# Rules without classes that still style the shell
+CRITICAL_ELEMENT_SELECTORS = {':root', '[data-bs-theme=light]', '*', '*::before', '*::after', 'html', 'body',
+                              'a', 'h5', 'hr', 'p', 'ul', 'li', 'address', 'main', 'nav', 'footer'}
+
+
+def _is_minified(path):
+    return '.min.' in posixpath.basename(path)
+
+
+def rewrite_urls(css, source, target):
+    """
+    Make the relative ``url()`` references of ``source`` valid from ``target``
+    """
+    source_dir = posixpath.dirname(source)
+    target_dir = posixpath.dirname(target)
+
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        resolved = posixpath.normpath(posixpath.join(source_dir, url))
+        return f'url({posixpath.relpath(resolved, target_dir)})'
+
+    return URL_RE.sub(replace, css)
+
+
+def _split_strings(text):
+    """
+    Yield ``(is_string, chunk)`` so minifiers never touch quoted text
+    """
+    pattern = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+    for index, chunk in enumerate(pattern.split(text)):
+        if chunk:
+            yield index % 2 == 1, chunk
+
+
+def minify_css(css):
+    out = []
+    for is_string, chunk in _split_strings(css):
+        if not is_string:
+            # Keep /*! license */ comments, drop the rest
+            chunk = re.sub(r'/\*(?!!).*?\*/', '', chunk, flags=re.S)
+            chunk = re.sub(r'\s+', ' ', chunk)
+            chunk = re.sub(r'\s*([{};,>])\s*', r'\1', chunk)
+            chunk = re.sub(r':\s+', ':', chunk)
+            chunk = chunk.replace(';}', '}')
+        out.append(chunk)
+    return ''.join(out).strip()
+
+
+def minify_js(js):
+    """
+    Conservative minification: strip indentation, blank lines and lines
+    that are only ``//`` comments. Line breaks stay so automatic semicolon
+    insertion keeps working.
+    """
+    lines = []
+    for line in js.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith('//'):
+            lines.append(stripped)
+    return '\n'.join(lines)
+
+
+def build_bundle(static_dir, target, sources):
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_dir, source), encoding='utf-8') as handle:
+            content = handle.read()
+        if target.endswith('.css'):
+            content = rewrite_urls(content, source, target)
+            if not _is_minified(source):
+                content = minify_css(content)
+        elif not _is_minified(source):
+            content = minify_js(content)
+        parts.append(f'/* {source} */\n{content.strip()}')
+    # Scripts are joined with semicolons in case a file lacks a trailing one
+    separator = '\n' if target.endswith('.css') else '\n;\n'
+    return separator.join(parts) + '\n'
+
+
+def _blocks(css):
+    """
+    Split a stylesheet into top-level ``(prelude, body)`` pairs
+    """
+    blocks = []
+    depth = 0
+    start = 0
+    prelude = None
+    body_start = 0
+    for is_string, chunk in _split_strings(css):
+        if is_string:
+            start += len(chunk)
+            continue
+        for offset, char in enumerate(chunk):
+            position = start + offset
+            if char == '{':
+                if depth == 0:
+                    prelude = css[body_start:position]
+                    body_start = position + 1
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    blocks.append((prelude.strip(), css[body_start:position]))
+                    body_start = position + 1
+            elif char == ';' and depth == 0:
+                # Statement at-rules such as @charset
+                blocks.append((css[body_start:position].strip(), None))
+                body_start = position + 1
+        start += len(chunk)
+    return blocks
+
+
+def shell_classes(template_paths):
+    classes = set()
+    for path in template_paths:
+        with open(path, encoding='utf-8') as handle:
+            for attribute in CLASS_ATTR_RE.findall(handle.read()):
+                classes.update(name for name in attribute.split() if '{' not in name)
+    return classes
+
+
+def _selector_is_critical(selector, classes):
+    selector = selector.strip()
+    used = SELECTOR_CLASS_RE.findall(selector)
+    if used:
+        return all(name in classes for name in used)
+    return selector in CRITICAL_ELEMENT_SELECTORS
+
+
+def extract_critical(css, classes):
+    """
+    Keep the rules (also inside @media/@supports) whose selectors only use
+    ``classes``. Fonts and keyframes are left to the full stylesheet.
+    """
+    out = []
+    for prelude, body in _blocks(css):
+        if prelude.startswith('/*'):
+            prelude = re.sub(r'/\*.*?\*/', '', prelude, flags=re.S).strip()
+        if body is None:
+            continue
+        if prelude.startswith(('@media', '@supports')):
+            inner = extract_critical(body, classes)
+            if inner:
+                out.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            continue
+        else:
+            selectors = [selector for selector in prelude.split(',') if _selector_is_critical(selector, classes)]
+            if selectors:
+                out.append(f"{','.join(selector.strip() for selector in selectors)}{{{body}}}")
+    return ''.join(out)
+
+
+def build(static_dir, template_dirs):
+    """
+    Write every bundle and the critical CSS. Returns ``{path: size}``.
+    """
+    written = {}
+    for target, sources in BUNDLES.items():
+        content = build_bundle(static_dir, target, sources)
+        written[target] = content
+    classes = shell_classes(
+        os.path.join(directory, name)
+        for name in CRITICAL_TEMPLATES
+        for directory in template_dirs
+        if os.path.exists(os.path.join(directory, name))
+    )
+    written[CRITICAL_OUTPUT] = extract_critical(written[CRITICAL_SOURCE], classes) + '\n'
+
+    sizes = {}
+    for target, content in written.items():
+        path = os.path.join(static_dir, target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8', newline='\n') as handle:
+            handle.write(content)
+        sizes[target] = len(content.encode('utf-8'))
+    return sizes
@@ -0,0 +1,72 @@
+"""
+A bounded, thread-safe in-process cache.
+
+Entries expire after their own TTL, and the least recently used entry is
+dropped once ``max_entries`` are stored. Every invalidation bumps
+``generation``, so a caller that read a value from somewhere slower can
+store it only if nothing was invalidated in the meantime (see ``set``).
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.generation = 0
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), least recently used first
+        self._entries = OrderedDict()
+        self._stats = Counter()
+
+    def get(self, key):
+        """
+        The value of ``key``, or ``MISSING``
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= now:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl, generation=None):
+        """
+        Store ``value`` for ``ttl`` seconds, unless ``generation`` is given
+        and something was invalidated since it was read. Returns whether the
+        value was stored.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+            return True
+
+    def delete(self, keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
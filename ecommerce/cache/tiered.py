@@ -0,0 +1,342 @@
+"""
+Two-tier cache backend: a small in-process cache in front of Redis.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'ecommerce.cache.tiered.TieredCache',
+            'LOCATION': 'redis',  # alias of the shared cache below
+            'OPTIONS': {'MAX_ENTRIES': 1000, 'POLICIES': {'catalog:': 60}},
+        },
+        'redis': {'BACKEND': 'django_redis.cache.RedisCache', ...},
+    }
+
+Keys are opted in by prefix: only keys starting with a prefix listed in
+``POLICIES`` are kept in process memory, for at most the given number of
+seconds, and that includes remembering that the shared cache lacks them.
+Every other key goes straight to the shared cache.
+
+Writes and deletes of opted-in keys are published on the ``CHANNEL`` of
+the shared Redis, and every process drops those keys from its memory when
+it hears about them, so the web instances stay coherent. The local tier is
+only used while the process is subscribed: while the subscription is down,
+reads go to Redis, and the local tier starts out empty once it is back
+since invalidations may have been missed. The TTLs bound how stale an
+entry can get if a message is lost anyway.
+
+``tier_stats()`` returns the hits and misses of both tiers in this process.
+"""
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+from .lru import MISSING, LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Stands for "the shared cache does not have it" in the local tier
+ABSENT = b''
+CLEAR_ALL = '*'
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def _forget_tiers():
+    # A forked child has no listener thread, so it must not trust the
+    # parent's entries
+    _tiers.clear()
+
+
+os.register_at_fork(after_in_child=_forget_tiers)
+
+
+def tier_stats():
+    """
+    Stats of every local tier in this process, keyed by shared cache alias
+    """
+    with _tiers_lock:
+        tiers = dict(_tiers)
+    return {location: tier.stats() for location, tier in tiers.items()}
+
+
+def _rate(hits, misses):
+    total = hits + misses
+    return round(hits / total, 3) if total else None
+
+
+class LocalTier:
+    """
+    The process-wide local tier over one shared cache, and the thread
+    listening for invalidations from the other processes
+    """
+    def __init__(self, location, max_entries, channel):
+        self.location = location
+        self.channel = channel
+        self.local = LRUCache(max_entries)
+        # Tells this process's own messages apart
+        self.origin = uuid.uuid4().hex
+        self.live = False
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        self._listener = None
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _redis(self):
+        return caches[self.location].client.get_client(write=True)
+
+    def listen(self):
+        """
+        Start the invalidation listener unless it is running
+        """
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(
+                target=self._listen, name=f'cache-invalidation-{self.location}', daemon=True,
+            )
+        self._listener.start()
+
+    def _listen(self):
+        delay = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._redis().pubsub()
+                pubsub.subscribe(self.channel)
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    if message['type'] == 'subscribe':
+                        # Anything invalidated before now may have been missed
+                        self.local.clear()
+                        self.live = True
+                        delay = 1
+                    elif message['type'] == 'message':
+                        self._apply(message['data'])
+            except Exception as exc:
+                if self.live:
+                    logger.warning(f"Lost cache invalidation channel {self.channel}, bypassing the local tier: {exc}")
+                self.live = False
+                self.local.clear()
+                self.count('listener_errors')
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _apply(self, data):
+        payload = json.loads(data)
+        if payload['origin'] == self.origin:
+            return
+        self.count('invalidations_received')
+        if payload['keys'] == CLEAR_ALL:
+            self.local.clear()
+        else:
+            self.local.delete(payload['keys'])
+
+    def invalidate(self, keys):
+        """
+        Drop ``keys`` (or ``CLEAR_ALL``) here and in every other process
+        """
+        if keys == CLEAR_ALL:
+            self.local.clear()
+        else:
+            self.local.delete(keys)
+        try:
+            self._redis().publish(self.channel, json.dumps({'origin': self.origin, 'keys': keys}))
+            self.count('invalidations_sent')
+        except Exception as exc:
+            # Other processes keep their copies until the TTL runs out
+            logger.warning(f"Could not publish cache invalidation: {exc}")
+            self.count('publish_errors')
+
+    def stats(self):
+        """
+        Counters since start, the number of local entries and the hit rate
+        of each tier
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(self.local.stats())
+        stats['live'] = self.live
+        stats['l1_hit_rate'] = _rate(stats.get('l1_hits', 0), stats.get('l1_misses', 0))
+        stats['l2_hit_rate'] = _rate(stats.get('l2_hits', 0), stats.get('l2_misses', 0))
+        return stats
+
+
+def _get_tier(location, max_entries, channel):
+    tier = _tiers.get(location)
+    if tier is not None:
+        return tier
+    with _tiers_lock:
+        tier = _tiers.get(location)
+        if tier is None:
+            tier = _tiers[location] = LocalTier(location, max_entries, channel)
+    # Without pub/sub the local tier could serve stale data, so it stays off
+    if hasattr(caches[location], 'client'):
+        tier.listen()
+    return tier
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._location = location
+        self._channel = options.get('CHANNEL', 'cache:invalidate')
+        # Longest prefix first
+        self._policies = sorted(options.get('POLICIES', {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    @cached_property
+    def shared(self):
+        return caches[self._location]
+
+    @property
+    def client(self):
+        # Lets django_redis.get_redis_connection() reach the shared Redis
+        return self.shared.client
+
+    def _tier(self):
+        return _get_tier(self._location, self._max_entries, self._channel)
+
+    def stats(self):
+        return self._tier().stats()
+
+    def _local_ttl(self, key):
+        for prefix, ttl in self._policies:
+            if key.startswith(prefix):
+                return ttl
+        return None
+
+    def _get_shared(self, tier, key, version):
+        value = self.shared.get(key, MISSING, version=version)
+        tier.count('l2_misses' if value is MISSING else 'l2_hits')
+        return value
+
+    def _store_local(self, tier, local_key, value, ttl, generation):
+        packed = ABSENT if value is MISSING else pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        tier.local.set(local_key, packed, ttl, generation)
+
+    def get(self, key, default=None, version=None):
+        tier = self._tier()
+        ttl = self._local_ttl(key)
+        if ttl is None:
+            value = self._get_shared(tier, key, version)
+            return default if value is MISSING else value
+
+        local_key = self.make_key(key, version)
+        generation = None
+        if tier.live:
+            packed = tier.local.get(local_key)
+            if packed is not MISSING:
+                tier.count('l1_hits')
+                return default if packed is ABSENT else pickle.loads(packed)
+            tier.count('l1_misses')
+            # Read before the shared tier so a concurrent invalidation wins
+            generation = tier.local.generation
+        else:
+            tier.count('l1_bypassed')
+        value = self._get_shared(tier, key, version)
+        if generation is not None:
+            self._store_local(tier, local_key, value, ttl, generation)
+        return default if value is MISSING else value
+
+    def get_many(self, keys, version=None):
+        tier = self._tier()
+        generation = tier.local.generation if tier.live else None
+        found = {}
+        remote = []
+        # key -> (local key, ttl) of local misses to fill from the shared tier
+        fills = {}
+        for key in keys:
+            ttl = self._local_ttl(key)
+            if ttl is None:
+                remote.append(key)
+                continue
+            if generation is None:
+                tier.count('l1_bypassed')
+                remote.append(key)
+                continue
+            local_key = self.make_key(key, version)
+            packed = tier.local.get(local_key)
+            if packed is MISSING:
+                tier.count('l1_misses')
+                remote.append(key)
+                fills[key] = (local_key, ttl)
+            else:
+                tier.count('l1_hits')
+                if packed is not ABSENT:
+                    found[key] = pickle.loads(packed)
+        if remote:
+            shared = self.shared.get_many(remote, version=version)
+            tier.count('l2_hits', len(shared))
+            tier.count('l2_misses', len(remote) - len(shared))
+            found.update(shared)
+            for key, (local_key, ttl) in fills.items():
+                self._store_local(tier, local_key, shared.get(key, MISSING), ttl, generation)
+        return found
+
+    def has_key(self, key, version=None):
+        if self._local_ttl(key) is None:
+            return self.shared.has_key(key, version=version)
+        return self.get(key, MISSING, version=version) is not MISSING
+
+    def _invalidate(self, keys, version):
+        local_keys = [self.make_key(key, version) for key in keys if self._local_ttl(key) is not None]
+        if local_keys:
+            self._tier().invalidate(local_keys)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._invalidate([key], version)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        result = self.shared.set(key, value, timeout, version=version)
+        self._invalidate([key], version)
+        return result
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.shared.delete(key, version=version)
+        self._invalidate([key], version)
+        return deleted
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        self._invalidate(list(data), version)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        result = self.shared.delete_many(keys, version=version)
+        self._invalidate(keys, version)
+        return result
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._invalidate([key], version)
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        self._tier().invalidate(CLEAR_ALL)
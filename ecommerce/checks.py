@@ -0,0 +1,102 @@
+"""
+Startup checks of the production settings profile.
+
+With ``DJANGO_PROFILE=production`` every management command refuses to run
+while one of these errors is reported, and ``asgi.py``/``wsgi.py`` refuse
+to start (servers such as daphne do not run system checks themselves).
+"""
+import logging
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.core.exceptions import ImproperlyConfigured
+
+CACHED_LOADER = 'django.template.loaders.cached.Loader'
+DEBUG_CACHE_BACKENDS = {
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+DEBUG_CHANNEL_LAYERS = {'channels.layers.InMemoryChannelLayer'}
+
+
+def _uses_cached_loader(template_settings):
+    if template_settings['BACKEND'] != 'django.template.backends.django.DjangoTemplates':
+        return True
+    loaders = template_settings.get('OPTIONS', {}).get('loaders', [])
+    return bool(loaders) and all(
+        isinstance(loader, (tuple, list)) and loader[0] == CACHED_LOADER for loader in loaders
+    )
+
+
+def production_errors():
+    """
+    Settings that are fine while developing but not in production
+    """
+    errors = []
+    if settings.DEBUG:
+        errors.append(Error(
+            'DEBUG is on, so every SQL query is kept in memory and error pages leak settings.',
+            hint='Unset DJANGO_DEBUG.', id='ecommerce.E001',
+        ))
+    key = settings.SECRET_KEY
+    if key.startswith('django-insecure-') or len(key) < 50 or len(set(key)) < 5:
+        errors.append(Error(
+            'SECRET_KEY is the development key or too short.',
+            hint='Set DJANGO_SECRET_KEY to a random value of at least 50 characters.', id='ecommerce.E002',
+        ))
+    if not settings.ALLOWED_HOSTS or '*' in settings.ALLOWED_HOSTS:
+        errors.append(Error(
+            'ALLOWED_HOSTS is empty or allows every host.',
+            hint='Set DJANGO_ALLOWED_HOSTS to the comma-separated site hostnames.', id='ecommerce.E003',
+        ))
+    for template_settings in settings.TEMPLATES:
+        if template_settings.get('OPTIONS', {}).get('debug') or not _uses_cached_loader(template_settings):
+            errors.append(Error(
+                'Templates are re-read from disk or rendered in debug mode.',
+                hint='Wrap the template loaders in django.template.loaders.cached.Loader.', id='ecommerce.E004',
+            ))
+    if logging.getLogger('django.db.backends').isEnabledFor(logging.DEBUG):
+        errors.append(Error(
+            'The django.db.backends logger logs every SQL query.',
+            hint='Set DB_LOG_LEVEL to INFO or higher.', id='ecommerce.E005',
+        ))
+    for alias, cache_settings in settings.CACHES.items():
+        if cache_settings['BACKEND'] in DEBUG_CACHE_BACKENDS:
+            errors.append(Error(
+                f"Cache '{alias}' is not shared between processes ({cache_settings['BACKEND']}).",
+                id='ecommerce.E006',
+            ))
+    for alias, layer_settings in getattr(settings, 'CHANNEL_LAYERS', {}).items():
+        if layer_settings['BACKEND'] in DEBUG_CHANNEL_LAYERS:
+            errors.append(Error(
+                f"Channel layer '{alias}' does not reach the other web instances.",
+                id='ecommerce.E007',
+            ))
+    if getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False):
+        errors.append(Error(
+            'CORS_ALLOW_ALL_ORIGINS lets any site make credentialed requests.',
+            hint='List the allowed origins in CORS_ALLOWED_ORIGINS.', id='ecommerce.E008',
+        ))
+    return errors
+
+
+@register(Tags.security)
+def check_production_profile(app_configs, **kwargs):
+    if not getattr(settings, 'PRODUCTION', False):
+        return []
+    return production_errors()
+
+
+def enforce_production_profile():
+    """
+    Raise ``ImproperlyConfigured`` if the production profile runs with
+    debug-grade settings
+    """
+    if not getattr(settings, 'PRODUCTION', False):
+        return
+    errors = production_errors()
+    if errors:
+        raise ImproperlyConfigured(
+            'Refusing to start the production profile:\n' +
+            '\n'.join(f'{error.id}: {error.msg}' for error in errors)
+        )
@@ -0,0 +1,90 @@
+"""
+MySQL backend that checks connections out of a per-process pool.
+
+Use it as ``'ENGINE': 'ecommerce.db.mysql'`` and tune it with a ``POOL``
+entry next to ``OPTIONS`` (keys as in ``ConnectionPool``):
+
+    'POOL': {'size': 10, 'max_overflow': 5, 'timeout': 10, 'max_lifetime': 1800}
+
+Django still opens and closes its connection around every request and every
+``database_sync_to_async`` call (keep ``CONN_MAX_AGE`` at 0). Opening takes
+a connection from the pool and closing gives it back, so the TCP handshake
+and MySQL authentication only happen when the pool grows.
+
+Each alias has one pool at a time, built for the connection parameters it
+was first opened with. When they change, e.g. when the test runner switches
+``NAME`` to the test database, the old pool is retired and a new one built.
+"""
+import hashlib
+import os
+import threading
+
+from django.db.backends.mysql.base import Database
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+from ecommerce.db.pool import ConnectionPool, PoolTimeout
+
+# alias -> (parameters key, pool)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _forget_pools():
+    # A forked child must not share the parent's sockets
+    _pools.clear()
+
+
+os.register_at_fork(after_in_child=_forget_pools)
+
+
+def pool_stats():
+    """
+    Stats of every pool in this process, keyed by database alias
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, (_, pool) in pools.items()}
+
+
+def _params_key(conn_params, pool_options):
+    # Digest rather than the parameters themselves, which hold the password
+    return hashlib.sha256(repr((sorted(conn_params.items()), sorted(pool_options.items()))).encode()).hexdigest()
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+    _pool = None
+
+    def _get_pool(self, conn_params):
+        pool_options = self.settings_dict.get('POOL', {})
+        key = _params_key(conn_params, pool_options)
+        with _pools_lock:
+            current_key, pool = _pools.get(self.alias, (None, None))
+            if current_key == key:
+                return pool
+            stale = pool
+            pool = ConnectionPool(
+                lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+                **pool_options
+            )
+            _pools[self.alias] = (key, pool)
+        if stale is not None:
+            stale.close()
+        return pool
+
+    def get_new_connection(self, conn_params):
+        pool = self._get_pool(conn_params)
+        try:
+            connection = pool.acquire()
+        except PoolTimeout as exc:
+            # Surfaces as django.db.OperationalError
+            raise Database.OperationalError(str(exc)) from exc
+        # Released to the pool it came from, even if that has been retired
+        self._pool = pool
+        return connection
+
+    def _close(self):
+        pool = self._pool
+        if pool is None:
+            return super()._close()
+        # Closed mid-transaction or after an error: the session state is unknown
+        pool.release(self.connection, discard=self.in_atomic_block or self.errors_occurred)
@@ -0,0 +1,202 @@
+"""
+A bounded, thread-safe pool of DB-API connections.
+
+Up to ``size`` connections are kept open between checkouts. When all of
+them are in use, up to ``max_overflow`` extra connections are opened and
+closed again once they are returned and nobody is waiting. Beyond that, callers wait up to
+``timeout`` seconds and then get ``PoolTimeout``.
+
+Connections older than ``max_lifetime`` are closed instead of reused, which
+keeps them below MySQL's ``wait_timeout`` and spreads reconnects out after a
+failover. Idle connections that have not been used for
+``health_check_interval`` seconds are pinged on checkout and replaced if the
+ping fails. Returned connections are rolled back before reuse.
+
+A connection belongs to one caller from checkout to release, so it is safe
+for ``sync_to_async`` to run consecutive checkouts on different threads.
+"""
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, size=10, max_overflow=5, timeout=10.0, max_lifetime=30 * 60,
+                 health_check_interval=30.0, ping=None, reset=None):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self._ping = ping or (lambda conn: conn.ping())
+        self._reset = reset or (lambda conn: conn.rollback())
+
+        self._cond = threading.Condition()
+        # (connection, opened_at, returned_at), most recently returned last
+        self._idle = deque()
+        self._opened_at = {}
+        self._open = 0
+        self._waiting = 0
+        self._stats = Counter()
+        self.closed = False
+
+    def acquire(self):
+        """
+        Check out a connection, opening one if the pool has room
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn, opened_at, returned_at = self._take(deadline)
+            if conn is None:
+                return self._open_connection()
+            if time.monotonic() - returned_at < self.health_check_interval:
+                return conn
+            try:
+                self._ping(conn)
+                return conn
+            except Exception as exc:
+                logger.warning(f"Discarding pooled connection that failed its health check: {exc}")
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                self._discard(conn)
+
+    def _take(self, deadline):
+        """
+        Pop a reusable idle connection, or reserve a slot for a new one by
+        returning ``(None, None, None)``
+        """
+        expired = []
+        try:
+            with self._cond:
+                waited = False
+                while True:
+                    while self._idle:
+                        conn, opened_at, returned_at = self._idle.pop()
+                        if time.monotonic() - opened_at > self.max_lifetime:
+                            # Free its slot now, close it outside the lock
+                            self._open -= 1
+                            self._opened_at.pop(id(conn), None)
+                            self._stats['expired'] += 1
+                            expired.append(conn)
+                            continue
+                        self._stats['checkouts'] += 1
+                        return conn, opened_at, returned_at
+
+                    if self._open < self.size + self.max_overflow:
+                        self._open += 1
+                        self._stats['checkouts'] += 1
+                        if self._open > self.size:
+                            self._stats['overflow'] += 1
+                        return None, None, None
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No connection available within {self.timeout}s "
+                            f"({self._open} open, pool size {self.size} + {self.max_overflow} overflow)"
+                        )
+                    if not waited:
+                        self._stats['waits'] += 1
+                        waited = True
+                    started = time.monotonic()
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                    self._stats['wait_ms'] += int((time.monotonic() - started) * 1000)
+        finally:
+            for conn in expired:
+                self._close(conn)
+
+    def _open_connection(self):
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._stats['connect_errors'] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._opened_at[id(conn)] = time.monotonic()
+            self._stats['connects'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """
+        Return a checked-out connection. Broken connections should be
+        returned with ``discard=True``.
+        """
+        now = time.monotonic()
+        opened_at = self._opened_at.get(id(conn), now)
+        if not discard:
+            try:
+                self._reset(conn)
+            except Exception:
+                discard = True
+        with self._cond:
+            self._stats['releases'] += 1
+            # Overflow connections are closed unless someone is waiting for one
+            keep = (not discard and not self.closed and (self._open <= self.size or self._waiting) and
+                    now - opened_at <= self.max_lifetime)
+            if keep:
+                self._idle.append((conn, opened_at, now))
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        with self._cond:
+            self._open -= 1
+            self._opened_at.pop(id(conn), None)
+            self._stats['discards'] += 1
+            self._cond.notify()
+        self._close(conn)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_idle(self):
+        """
+        Close every idle connection, e.g. at shutdown
+        """
+        with self._cond:
+            idle = [conn for conn, _, _ in self._idle]
+            self._idle.clear()
+            self._open -= len(idle)
+            for conn in idle:
+                self._opened_at.pop(id(conn), None)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def close(self):
+        """
+        Retire the pool: close idle connections now and checked-out ones as
+        they are released
+        """
+        with self._cond:
+            self.closed = True
+        self.close_idle()
+
+    def stats(self):
+        """
+        Counters since start plus the current open/idle/in-use gauges
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(open=self._open, idle=len(self._idle), in_use=self._open - len(self._idle))
+        return stats
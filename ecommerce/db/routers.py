@@ -0,0 +1,298 @@
+"""
+Read-replica routing.
+
+Every database alias other than ``default`` listed in ``DATABASE_REPLICAS``
+is treated as a read replica of ``default``. Reads go to a replica only
+inside views marked with ``replica_reads``, and only when all of these
+hold:
+
+- the read is not inside a transaction on the primary;
+- the visitor has not written recently (read-your-writes);
+- the catalog has not been changed in the last few seconds;
+- the replica's measured lag is at most ``DATABASE_REPLICA_MAX_LAG`` seconds.
+
+Otherwise, and for every write, ``default`` is used.
+
+Writes made during a request pin the visitor to the primary for
+``DATABASE_PIN_SECONDS``. This is recorded in a cookie set by
+``PrimaryPinMiddleware``. Writes made outside a request, such as chat
+messages sent over a WebSocket, pin the user with ``pin_user``.
+
+Replica lag is read from ``SHOW REPLICA STATUS`` on MySQL and treated as
+zero on other backends. It is re-measured every
+``DATABASE_REPLICA_LAG_CHECK_INTERVAL`` seconds per process. Set
+``DATABASE_REPLICA_LAG_FUNCTION`` to a dotted path to measure it some
+other way. To try the router locally, point ``default`` and a ``replica1``
+alias at two SQLite files (``DB_REPLICA_URLS=sqlite:///replica.sqlite3``)
+and migrate both.
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+REPLICAS = list(getattr(settings, 'DATABASE_REPLICAS', []))
+PIN_SECONDS = getattr(settings, 'DATABASE_PIN_SECONDS', 10)
+MAX_LAG = getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 5)
+LAG_CHECK_INTERVAL = getattr(settings, 'DATABASE_REPLICA_LAG_CHECK_INTERVAL', 5)
+
+PIN_COOKIE = 'db_pin'
+GLOBAL_PIN_KEY = 'db:pin:global'
+
+_lag_lock = threading.Lock()
+# alias -> (checked_at, lag in seconds or None when unknown)
+_lag_checks = {}
+
+
+def user_pin_key(user_id):
+    return f'db:pin:user:{user_id}'
+
+
+class RoutingState:
+    """
+    Routing decisions of one request or ``replica_reads`` block. Mutated in
+    place so changes made in a ``sync_to_async`` thread are seen outside it.
+    """
+    __slots__ = ('pinned', 'wrote', 'replica_reads', 'request', 'user', 'replica')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica_reads = False
+        self.request = None
+        # Set by views that authenticate the user themselves
+        self.user = None
+        # Chosen on the first replica-eligible read, then kept for the request
+        self.replica = None
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+def pin_user(user_id):
+    """
+    Send ``user_id``'s reads to the primary for a while after a write made
+    outside an HTTP request
+    """
+    cache.set(user_pin_key(user_id), 1, PIN_SECONDS)
+
+
+async def apin_user(user_id):
+    await cache.aset(user_pin_key(user_id), 1, PIN_SECONDS)
+
+
+def pin_everyone(seconds=None):
+    """
+    Send every read to the primary until replicas have caught up with a
+    change that affects all visitors, such as a catalog edit
+    """
+    cache.set(GLOBAL_PIN_KEY, 1, seconds or MAX_LAG + LAG_CHECK_INTERVAL)
+
+
+def mysql_replica_lag(alias):
+    with connections[alias].cursor() as cursor:
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except Exception:
+            # Before MySQL 8.0.22
+            cursor.execute('SHOW SLAVE STATUS')
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        columns = [column[0] for column in cursor.description]
+    status = dict(zip(columns, row))
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    # NULL while replication is stopped
+    return None if lag is None else int(lag)
+
+
+def replica_lag(alias):
+    if connections[alias].vendor == 'mysql':
+        return mysql_replica_lag(alias)
+    return 0
+
+
+def measured_lag(alias):
+    """
+    The replica's lag, measured at most once per check interval
+    """
+    now = time.monotonic()
+    with _lag_lock:
+        checked = _lag_checks.get(alias)
+        if checked is not None and now - checked[0] < LAG_CHECK_INTERVAL:
+            return checked[1]
+    try:
+        lag_function = import_string(getattr(settings, 'DATABASE_REPLICA_LAG_FUNCTION', 'ecommerce.db.routers.replica_lag'))
+        lag = lag_function(alias)
+    except Exception as exc:
+        logger.warning(f"Could not measure lag of replica {alias}: {exc}")
+        lag = None
+    with _lag_lock:
+        _lag_checks[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    replicas = []
+    for alias in REPLICAS:
+        lag = measured_lag(alias)
+        if lag is not None and lag <= MAX_LAG:
+            replicas.append(alias)
+    return replicas
+
+
+def _pinned(state):
+    if state.pinned:
+        return True
+    keys = [GLOBAL_PIN_KEY]
+    user = state.user
+    request = state.request
+    # Only look the user up when the request can belong to one
+    if user is None and request is not None and (settings.SESSION_COOKIE_NAME in request.COOKIES or
+                                                 'Authorization' in request.headers):
+        user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        keys.append(user_pin_key(user.pk))
+    return bool(cache.get_many(keys))
+
+
+def _choose_replica(state):
+    if state.replica is None:
+        replicas = [] if _pinned(state) else healthy_replicas()
+        state.replica = random.choice(replicas) if replicas else PRIMARY
+    return state.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads or not REPLICAS:
+            return PRIMARY
+        # Reads inside a transaction must see its writes
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return _choose_replica(state)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            # Reads after a write in the same request must see it
+            state.replica = PRIMARY
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+@contextlib.contextmanager
+def replica_scope(request=None, user=None):
+    """
+    Let the reads in the block go to a replica, on behalf of ``request`` or
+    an already authenticated ``user``
+    """
+    state = _state.get()
+    token = None
+    if state is None:
+        state = RoutingState()
+        token = _state.set(state)
+    previous = state.replica_reads, state.request, state.user
+    state.replica_reads = True
+    state.request = request if request is not None else state.request
+    state.user = user if user is not None else state.user
+    try:
+        yield state
+    finally:
+        state.replica_reads, state.request, state.user = previous
+        if token is not None:
+            _state.reset(token)
+
+
+def _find_request(args):
+    # Function views get the request first, view methods second
+    for arg in args[:2]:
+        if hasattr(arg, 'COOKIES'):
+            return arg
+    return None
+
+
+def replica_reads(view):
+    """
+    Let the reads of a read-only view (or view method) go to a replica
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            with replica_scope(_find_request(args)):
+                return await view(*args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_scope(_find_request(args)):
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class PrimaryPinMiddleware:
+    """
+    Track writes per request and pin the visitor to the primary after one
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(pinned=self._pinned(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=self._pinned(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(state, response)
+
+    def _pinned(self, request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _pin(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time() + PIN_SECONDS)),
+                max_age=PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
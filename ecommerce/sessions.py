@@ -0,0 +1,113 @@
+"""
+Session storage.
+
+Sessions live in their own cache alias, ``sessions``, on a Redis instance
+that holds nothing else, so large cached pages cannot evict them. With
+``SESSION_STORE=cached_db`` (the default) every session is also written to
+the database and Redis is only a read-through cache: an evicted session or
+a Redis outage costs a query instead of a login. ``SESSION_STORE=cache``
+keeps sessions in Redis alone.
+
+Session data is packed with msgpack, both in Redis and in the database.
+
+Anonymous visitors often keep a session cookie, e.g. after starting a
+sign-up or social login. ``AnonymousSessionMiddleware`` remembers in a
+second cookie that such a session has no user, so later catalog hits
+resolve ``request.user`` without loading the session at all. The hint
+names the session it was made for, and logging in always starts a new
+session, so it can never hide a signed-in user. It is also dropped whenever
+a request changes its session.
+"""
+import hashlib
+
+import msgpack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import SimpleLazyObject, empty
+
+ANONYMOUS_COOKIE = 'session_anon'
+
+
+class MsgPackSerializer:
+    """
+    Usable as ``SESSION_SERIALIZER`` and as a django_redis ``SERIALIZER``
+    """
+    def __init__(self, options=None):
+        pass
+
+    def dumps(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, value):
+        return msgpack.unpackb(value, raw=False)
+
+
+def _hint(session_key):
+    return hashlib.md5(session_key.encode()).hexdigest()[:16]
+
+
+def _resolved_anonymous(request):
+    """
+    Whether the user was looked up during the request, through
+    ``request.user`` or ``request.auser()``, and is anonymous
+    """
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    if user is None:
+        user = request.__dict__.get('_acached_user')
+    return user is not None and not user.is_authenticated
+
+
+class AnonymousSessionMiddleware:
+    """
+    Skip loading sessions known to have no user. Must come right after
+    ``AuthenticationMiddleware``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        known_anonymous = self._process_request(request)
+        return self._process_response(request, self.get_response(request), known_anonymous)
+
+    async def __acall__(self, request):
+        known_anonymous = self._process_request(request)
+        return self._process_response(request, await self.get_response(request), known_anonymous)
+
+    def _process_request(self, request):
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        known_anonymous = bool(session_key) and request.COOKIES.get(ANONYMOUS_COOKIE) == _hint(session_key)
+        if known_anonymous:
+            user = AnonymousUser()
+            request.user = user
+
+            async def auser():
+                return user
+            request.auser = auser
+        return known_anonymous
+
+    def _process_response(self, request, response, known_anonymous):
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        session = getattr(request, 'session', None)
+        if session is not None and session.modified:
+            # SessionMiddleware will save, replace (login) or remove (logout)
+            # the session after this runs, so the hint may be outdated
+            if ANONYMOUS_COOKIE in request.COOKIES:
+                response.delete_cookie(ANONYMOUS_COOKIE, samesite='Lax')
+        elif session_key and not known_anonymous and _resolved_anonymous(request):
+            response.set_cookie(
+                ANONYMOUS_COOKIE, _hint(session_key),
+                max_age=settings.SESSION_COOKIE_AGE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -21,12 +21,15 @@ from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views 
 from django.views.generic import RedirectView
 from users import views as user_views
+from products import views as product_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('users/', include('users.urls')),
     path('cart/', include('cart.urls')),
     path('', include('products.urls')),
+    # Resized media images, before the development media route below
+    path('media/resize/<int:width>x<int:height>/<path:path>', product_views.resize_image, name='resize_image'),
     
     path('login/', auth_views.LoginView.as_view(template_name='users/login.html'), name='login'),
     path('logout/', user_views.custom_logout, name='logout'),
@@ -14,7 +14,6 @@ import os
 import sys
 import django
 from django.db import connection
-from django.conf import settings
 from collections import defaultdict
 
 # Setup Django
@@ -24,7 +23,7 @@ django.setup()
 def get_table_indexes():
     """Get all indexes in the database and their usage statistics"""
     with connection.cursor() as cursor:
-        if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
+        if connection.vendor == 'mysql':
             # MySQL query
             cursor.execute("""
                 SELECT
@@ -92,13 +91,10 @@ def get_table_indexes():
             return indexes
 
 def analyze_table_queries():
-    """Analyze query patterns from Django's query log (when DEBUG=True)"""
-    if not settings.DEBUG:
-        print("DEBUG must be set to True in settings to log queries")
-        return {}
-    
-    # This would usually analyze Django's connection.queries
-    # but for this script we'll just return a simulated result
+    """Analyze the query patterns of the catalog and cart views"""
+    # This would usually analyze queries captured with CaptureQueriesContext
+    # (connection.queries is only filled with DEBUG on, which production
+    # settings refuse); for this script we'll just return a simulated result
     return {
         'products_product': [
             {'joins': ['products_category'], 'filters': ['available', 'category_id'], 'sort': ['name']},
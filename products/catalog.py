@@ -0,0 +1,246 @@
+"""
+Catalog versions for conditional GET on catalog pages.
+
+A version fingerprints a set of rows by their newest ``updated`` and their
+count, so deletions change it too. Versions of the category table, the
+whole product table and each category's products are memoized in the cache
+and dropped by ``signals.py`` whenever a row changes. ``catalog:`` keys are
+also kept in process memory by the default cache (ecommerce/cache), so
+checking whether a page changed usually costs no round trip at all, and
+no rendering.
+
+``conditional_page`` turns the versions of a page into an ETag (plus
+Last-Modified for shared pages) and answers matching requests with 304
+before the view runs. Anonymous pages without a CSRF token are marked
+public so nginx can micro-cache them for ``CATALOG_SHARED_MAX_AGE``
+seconds; everything else is private and revalidated on every use.
+
+With ``CATALOG_PAGE_CACHE`` on, every visitor gets the same page instead.
+It is rendered once per URL and catalog version as if for an anonymous
+visitor, stored in the cache and served publicly to everyone. The navbar,
+messages, chat button and CSRF token are then filled in by the page from
+the ``page_fragments`` endpoint. Serving a cached page never touches the
+session.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from cart.versions import cart_version
+from ecommerce.db.routers import pin_everyone
+
+from .models import Category, Product
+
+VERSION_TTL = 60 * 60 * 24
+# Seconds nginx may serve an anonymous catalog page without asking Django
+SHARED_MAX_AGE = getattr(settings, 'CATALOG_SHARED_MAX_AGE', 10)
+PAGE_CACHE = getattr(settings, 'CATALOG_PAGE_CACHE', False)
+PAGE_CACHE_TTL = getattr(settings, 'CATALOG_PAGE_CACHE_TTL', 60 * 15)
+# Stands in for the CSRF token in shared pages until the visitor's arrives
+CSRF_PLACEHOLDER = 'page-fragments'
+
+CATEGORIES_KEY = 'catalog:categories'
+PRODUCTS_KEY = 'catalog:products'
+
+
+def category_products_key(category_id):
+    return f'catalog:products:{category_id}'
+
+
+def product_category_key(product_slug):
+    return f'catalog:product:{product_slug}'
+
+
+def category_list_key(version):
+    return f"catalog:category-list:{version['updated']}.{version['count']}"
+
+
+def _fingerprint(queryset):
+    row = queryset.aggregate(updated=Max('updated'), count=Count('pk'))
+    return {
+        'updated': int(row['updated'].timestamp()) if row['updated'] else 0,
+        'count': row['count'],
+    }
+
+
+def _load_categories():
+    version = _fingerprint(Category.objects.all())
+    # Lets category pages find their version without a query
+    version['slugs'] = dict(Category.objects.values_list('slug', 'id'))
+    return version
+
+
+def _load_products():
+    return _fingerprint(Product.objects.all())
+
+
+def _load_category_products(category_id):
+    return lambda: _fingerprint(Product.objects.filter(category_id=category_id))
+
+
+def _versions(loaders):
+    """
+    Fetch the versions of ``{key: loader}`` in one round trip, loading and
+    storing the missing ones
+    """
+    found = cache.get_many(list(loaders))
+    missing = {key: loader() for key, loader in loaders.items() if key not in found}
+    if missing:
+        cache.set_many(missing, VERSION_TTL)
+        found.update(missing)
+    return [found[key] for key in loaders]
+
+
+def invalidate(category_ids=(), product_slugs=(), categories=False):
+    keys = [PRODUCTS_KEY]
+    keys += [category_products_key(category_id) for category_id in category_ids]
+    keys += [product_category_key(product_slug) for product_slug in product_slugs]
+    if categories:
+        keys.append(CATEGORIES_KEY)
+    cache.delete_many(keys)
+    # Until replicas have the change, pages must not be rendered from them
+    # or they would be cached under the new version
+    pin_everyone()
+
+
+def category_list():
+    """
+    Every category, cached per version of the category table
+    """
+    version, = _versions({CATEGORIES_KEY: _load_categories})
+    key = category_list_key(version)
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set(key, categories, VERSION_TTL)
+    return categories
+
+
+def catalog_scope(request, *args, **kwargs):
+    """
+    Pages listing categories and products from the whole catalog
+    """
+    return _versions({CATEGORIES_KEY: _load_categories, PRODUCTS_KEY: _load_products})
+
+
+def category_scope(request, category_slug=None):
+    if category_slug is None:
+        return catalog_scope(request)
+    categories, = _versions({CATEGORIES_KEY: _load_categories})
+    category_id = categories['slugs'].get(category_slug)
+    if category_id is None:
+        # Unknown category, let the view answer 404
+        return None
+    products, = _versions({category_products_key(category_id): _load_category_products(category_id)})
+    return [categories, products]
+
+
+def product_scope(request, product_slug):
+    """
+    A product page shows the product, its category and related products
+    from the same category
+    """
+    key = product_category_key(product_slug)
+    category_id = cache.get(key)
+    if category_id is None:
+        category_id = Product.objects.filter(slug=product_slug).values_list('category_id', flat=True).first()
+        if category_id is None:
+            return None
+        cache.set(key, category_id, VERSION_TTL)
+    return _versions({
+        CATEGORIES_KEY: _load_categories,
+        category_products_key(category_id): _load_category_products(category_id),
+    })
+
+
+def _token(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _version_token(versions):
+    return _token(*(f"{version['updated']}.{version['count']}" for version in versions))
+
+
+def _shared_page(view, versions, request, *args, **kwargs):
+    """
+    The page rendering shared by every visitor, from the cache when possible
+    """
+    key = f'page:{_token(_version_token(versions), request.get_full_path())}'
+    page = cache.get(key)
+    if page is not None:
+        content, content_type = page
+        return HttpResponse(content, content_type=content_type)
+    # Picked up by the context processor to render as an anonymous visitor
+    request.shared_page = True
+    response = view(request, *args, **kwargs)
+    if response.status_code == 200 and not response.streaming:
+        cache.set(key, (response.content, response['Content-Type']), PAGE_CACHE_TTL)
+    return response
+
+
+def conditional_page(scope, csrf=False):
+    """
+    Answer GET/HEAD requests for a catalog page with 304 when the versions
+    returned by ``scope(request, *args, **kwargs)`` have not changed.
+
+    Pages rendering a ``{% csrf_token %}`` must pass ``csrf=True``: their
+    ETag then covers the visitor's CSRF cookie and they are never shared,
+    unless ``CATALOG_PAGE_CACHE`` punches the token out of the page.
+    The view can read ``request.catalog_version`` to version its own caches.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            # Queued messages are shown once, so that page is never reused
+            if not PAGE_CACHE and len(get_messages(request)):
+                return view(request, *args, **kwargs)
+            versions = scope(request, *args, **kwargs)
+            if versions is None:
+                return view(request, *args, **kwargs)
+
+            request.catalog_version = _version_token(versions)
+            if PAGE_CACHE:
+                shared = True
+                viewer = csrf_cookie = ''
+            else:
+                anonymous = not request.user.is_authenticated
+                shared = anonymous and not csrf
+                # The navbar shows the visitor's cart size
+                viewer = 'anonymous' if anonymous else (
+                    f'{request.user.pk}.{request.user.get_username()}.{cart_version(request.user.pk)}'
+                )
+                csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '') if csrf else ''
+            etag = quote_etag(_token(request.catalog_version, request.get_full_path(), viewer, csrf_cookie))
+            # Last-Modified cannot tell viewers apart, so only shared pages get one
+            last_modified = (max(version['updated'] for version in versions) or None) if shared else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                if PAGE_CACHE:
+                    response = _shared_page(view, versions, request, *args, **kwargs)
+                else:
+                    response = view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    response['ETag'] = etag
+                    if last_modified:
+                        response['Last-Modified'] = http_date(last_modified)
+
+            if shared:
+                patch_cache_control(response, public=True, max_age=0, s_maxage=SHARED_MAX_AGE)
+            else:
+                patch_cache_control(response, private=True, no_cache=True)
+            # Shared pages are the same whatever the cookies
+            if not PAGE_CACHE:
+                patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapper
+    return decorator
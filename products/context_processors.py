@@ -0,0 +1,18 @@
+from django.contrib.auth.models import AnonymousUser
+
+from .catalog import CSRF_PLACEHOLDER
+
+
+def shared_page(request):
+    """
+    Render pages for the shared page cache as seen by an anonymous visitor.
+    Must come after the auth, messages and csrf context processors.
+    """
+    if not getattr(request, 'shared_page', False):
+        return {}
+    return {
+        'shared_page': True,
+        'user': AnonymousUser(),
+        'messages': [],
+        'csrf_token': CSRF_PLACEHOLDER,
+    }
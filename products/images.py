@@ -0,0 +1,203 @@
+"""
+Responsive derivatives of product images.
+
+Every uploaded image is rendered at a few fixed widths in WebP, AVIF (when
+the installed Pillow can encode it) and a JPEG/PNG fallback, next to the
+media tree under ``derivatives/``:
+
+    products/2025/04/20/6.5.2.png
+    derivatives/products/2025/04/20/6.5.2/400w.webp
+
+Uploads are queued on a Redis list and rendered by the
+``process_image_queue`` worker. If Redis is unreachable they are rendered in
+a small in-process thread pool instead. Templates pick the derivatives up
+through the ``responsive_image`` tag, and ``generate_image_derivatives``
+backfills existing media.
+"""
+import io
+import logging
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_ROOT = 'derivatives'
+WIDTHS = tuple(getattr(settings, 'PRODUCT_IMAGE_WIDTHS', (200, 400, 800)))
+QUEUE_KEY = 'image_derivatives:queue'
+# Seconds the worker blocks on an empty queue before polling again
+QUEUE_WAIT = 5
+MANIFEST_TTL = 60 * 60 * 24
+
+# Output format -> (Pillow format, MIME type, save options)
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 55}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'image/png', {'optimize': True}),
+}
+
+_fallback_pool = None
+_queue_client = None
+
+
+def available_formats():
+    """
+    Modern formats this Pillow build can encode, best first
+    """
+    Image.init()
+    formats = []
+    # Built in since Pillow 11.3, or registered by pillow-avif-plugin
+    if 'AVIF' in Image.SAVE:
+        formats.append('avif')
+    if features.check('webp'):
+        formats.append('webp')
+    return formats
+
+
+def derivative_dir(name):
+    return posixpath.join(DERIVATIVE_ROOT, posixpath.splitext(name)[0])
+
+
+def derivative_name(name, width, fmt):
+    return posixpath.join(derivative_dir(name), f'{width}w.{fmt}')
+
+
+def _manifest_key(name):
+    return f'image_derivatives:{name}'
+
+
+def _encode(image, fmt):
+    pil_format, _, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_derivatives(name, force=False):
+    """
+    Render every derivative of the stored image ``name``. Returns the
+    manifest: output format -> list of widths generated.
+    """
+    with default_storage.open(name, 'rb') as source:
+        original = Image.open(source)
+        original.load()
+    original = ImageOps.exif_transpose(original)
+    has_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+    original = original.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'png' if has_alpha else 'jpg'
+
+    manifest = {}
+    for fmt in available_formats() + [fallback]:
+        for width in WIDTHS:
+            # Never upscale; the original serves the largest size
+            if width >= original.width:
+                continue
+            target = derivative_name(name, width, fmt)
+            if force or not default_storage.exists(target):
+                resized = original.copy()
+                resized.thumbnail((width, original.height), Image.LANCZOS)
+                if fmt == 'jpg':
+                    resized = resized.convert('RGB')
+                if default_storage.exists(target):
+                    default_storage.delete(target)
+                default_storage.save(target, ContentFile(_encode(resized, fmt)))
+            manifest.setdefault(fmt, []).append(width)
+
+    cache.set(_manifest_key(name), manifest, MANIFEST_TTL)
+    return manifest
+
+
+def derivatives(name):
+    """
+    Manifest of the derivatives available for ``name``, read from the
+    derivative directory once and then cached
+    """
+    manifest = cache.get(_manifest_key(name))
+    if manifest is not None:
+        return manifest
+    manifest = {}
+    try:
+        _, files = default_storage.listdir(derivative_dir(name))
+    except (FileNotFoundError, NotADirectoryError):
+        files = []
+    for filename in files:
+        stem, ext = os.path.splitext(filename)
+        fmt = ext.lstrip('.')
+        if fmt in FORMATS and stem.endswith('w') and stem[:-1].isdigit():
+            manifest.setdefault(fmt, []).append(int(stem[:-1]))
+    for widths in manifest.values():
+        widths.sort()
+    # Only remember complete results; a pending job refreshes the cache itself
+    if manifest:
+        cache.set(_manifest_key(name), manifest, MANIFEST_TTL)
+    return manifest
+
+
+def delete_derivatives(name):
+    directory = derivative_dir(name)
+    try:
+        _, files = default_storage.listdir(directory)
+    except (FileNotFoundError, NotADirectoryError):
+        files = []
+    for filename in files:
+        default_storage.delete(posixpath.join(directory, filename))
+    cache.delete(_manifest_key(name))
+
+
+def _generate_safely(name):
+    try:
+        generate_derivatives(name)
+    except Exception:
+        logger.exception(f"Could not generate derivatives of {name}")
+
+
+def enqueue(name):
+    """
+    Schedule derivative generation for a newly uploaded image
+    """
+    global _fallback_pool
+    try:
+        from django_redis import get_redis_connection
+        get_redis_connection('default').rpush(QUEUE_KEY, name)
+        return
+    except Exception as exc:
+        logger.warning(f"Image queue unavailable, rendering {name} in process: {exc}")
+    if _fallback_pool is None:
+        _fallback_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+    _fallback_pool.submit(_generate_safely, name)
+
+
+def _queue_connection():
+    """
+    Redis client for the worker's blocking pops. The cache's connections
+    time out after a second, shorter than BLPOP waits on an empty queue, so
+    the worker gets its own pool to the same server with room for the wait.
+    """
+    global _queue_client
+    if _queue_client is None:
+        import redis
+        from django_redis import get_redis_connection
+        pool = get_redis_connection('default').connection_pool
+        kwargs = dict(pool.connection_kwargs, socket_timeout=QUEUE_WAIT + 5)
+        _queue_client = redis.Redis(
+            connection_pool=redis.ConnectionPool(connection_class=pool.connection_class, **kwargs)
+        )
+    return _queue_client
+
+
+def dequeue(timeout=QUEUE_WAIT):
+    """
+    Block up to ``timeout`` seconds for the next queued image name
+    """
+    item = _queue_connection().blpop([QUEUE_KEY], timeout=timeout)
+    if item is None:
+        return None
+    name = item[1]
+    return name.decode() if isinstance(name, bytes) else name
@@ -0,0 +1,52 @@
+import statistics
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.cache.tiered import TieredCache
+from products import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the catalog cache reads of a page (versions and category list) "
+        "served by Redis alone with the in-process tier in front of it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--cache', default='default', help="Alias of the tiered cache")
+
+    def handle(self, *args, **options):
+        tiered = caches[options['cache']]
+        if not isinstance(tiered, TieredCache):
+            raise CommandError(f"Cache '{options['cache']}' does not use ecommerce.cache.tiered.TieredCache")
+        # Loads and stores the versions and the category list
+        catalog.category_list()
+        catalog.catalog_scope(None)
+        version, = catalog._versions({catalog.CATEGORIES_KEY: catalog._load_categories})
+        keys = [catalog.CATEGORIES_KEY, catalog.PRODUCTS_KEY]
+        list_key = catalog.category_list_key(version)
+
+        def page_reads(backend):
+            backend.get_many(keys)
+            backend.get(list_key)
+
+        for label, backend in (('redis', tiered.shared), ('tiered', tiered)):
+            timings = self.run(lambda: page_reads(backend), options['requests'])
+            timings.sort()
+            self.stdout.write(
+                f"{label:>6}: mean {statistics.mean(timings):.3f} ms, "
+                f"p50 {timings[len(timings) // 2]:.3f} ms, "
+                f"p95 {timings[int(len(timings) * 0.95)]:.3f} ms"
+            )
+        self.stdout.write(f"Tier stats: {tiered.stats()}")
+
+    def run(self, request, requests):
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
@@ -0,0 +1,61 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+from ecommerce.db.mysql.base import DatabaseWrapper as PooledDatabaseWrapper, pool_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-request connection overhead of the stock MySQL backend "
+        "(connect, query, disconnect) with the pooled backend"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=1, help="Concurrent simulated requests")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if not isinstance(connections[alias], PooledDatabaseWrapper):
+            raise CommandError(f"Database '{alias}' does not use the ecommerce.db.mysql backend")
+        settings_dict = connections[alias].settings_dict
+
+        def stock_request():
+            # A throwaway wrapper behaves like the old setup, one connection per request
+            wrapper = MySQLDatabaseWrapper(settings_dict, alias)
+            self.query(wrapper)
+
+        def pooled_request():
+            self.query(connections[alias])
+
+        for label, request in (('stock', stock_request), ('pooled', pooled_request)):
+            timings = self.run(request, options['requests'], options['threads'])
+            timings.sort()
+            self.stdout.write(
+                f"{label:>7}: mean {statistics.mean(timings):.2f} ms, "
+                f"p50 {timings[len(timings) // 2]:.2f} ms, "
+                f"p95 {timings[int(len(timings) * 0.95)]:.2f} ms"
+            )
+        self.stdout.write(f"Pool stats: {pool_stats().get(alias)}")
+
+    def query(self, wrapper):
+        wrapper.ensure_connection()
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        wrapper.close()
+
+    def run(self, request, requests, threads):
+        def timed(_):
+            started = time.perf_counter()
+            request()
+            return (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(timed, range(requests)))
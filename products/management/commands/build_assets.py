@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ecommerce import assets
+
+
+class Command(BaseCommand):
+    help = "Bundle and minify the site's CSS/JS into static/dist and extract the critical CSS"
+
+    def handle(self, *args, **options):
+        template_dirs = [directory for engine in settings.TEMPLATES for directory in engine.get('DIRS', [])]
+        sizes = assets.build(settings.STATICFILES_DIRS[0], template_dirs)
+        for target, size in sizes.items():
+            self.stdout.write(f"{target}: {size} bytes")
+        self.stdout.write(self.style.SUCCESS("Assets built; run collectstatic to fingerprint and compress them"))
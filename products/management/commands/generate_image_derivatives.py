@@ -0,0 +1,53 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from products import images
+from products.models import Product
+
+
+def _init_worker():
+    # Worker processes may be spawned rather than forked (e.g. on Windows)
+    import django
+    django.setup()
+
+
+def _generate(name, force):
+    from products import images
+    return name, images.generate_derivatives(name, force=force)
+
+
+class Command(BaseCommand):
+    help = "Backfill responsive derivatives for existing product images in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--force', action='store_true', help="Re-render derivatives that already exist")
+
+    def handle(self, *args, **options):
+        names = sorted(set(
+            Product.objects.exclude(image='').values_list('image', flat=True)
+        ))
+        self.stdout.write(
+            f"Rendering {len(names)} image(s) with {options['workers']} worker(s), "
+            f"formats: {', '.join(images.available_formats() + ['jpg/png'])}"
+        )
+
+        started = time.perf_counter()
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = {pool.submit(_generate, name, options['force']): name for name in names}
+            for future in as_completed(futures):
+                try:
+                    name, manifest = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{futures[future]}: {exc}")
+                    continue
+                self.stdout.write(f"{name}: {sum(len(widths) for widths in manifest.values())} derivative(s)")
+
+        elapsed = time.perf_counter() - started
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(f"Done in {elapsed:.1f}s, {failed} failure(s)"))
@@ -0,0 +1,51 @@
+import logging
+import signal
+from threading import Event
+
+from django.core.management.base import BaseCommand
+
+from products import images
+
+logger = logging.getLogger(__name__)
+
+# Longest pause between attempts while the queue is unreachable, in seconds
+MAX_BACKOFF = 60
+
+
+class Command(BaseCommand):
+    help = "Render derivatives of uploaded product images as they are queued"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        self.stopping = Event()
+        signal.signal(signal.SIGTERM, self.stop)
+        self.stdout.write("Waiting for product images...")
+        backoff = 0
+        while not self.stopping.is_set():
+            try:
+                name = images.dequeue()
+            except Exception as exc:
+                if options['once']:
+                    logger.warning(f"Image queue unavailable: {exc}")
+                    break
+                # Double the pause after every consecutive failure
+                backoff = min(backoff * 2 or 1, MAX_BACKOFF)
+                logger.warning(f"Image queue unavailable, retrying in {backoff}s: {exc}")
+                self.stopping.wait(backoff)
+                continue
+            backoff = 0
+            if name is None:
+                if options['once']:
+                    break
+                continue
+            try:
+                manifest = images.generate_derivatives(name)
+            except Exception:
+                logger.exception(f"Could not generate derivatives of {name}")
+                continue
+            self.stdout.write(f"{name}: {', '.join(f'{fmt} {widths}' for fmt, widths in manifest.items()) or 'no derivatives needed'}")
+
+    def stop(self, *args):
+        self.stopping.set()
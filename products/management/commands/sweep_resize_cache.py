@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products import resize
+
+
+class Command(BaseCommand):
+    help = "Delete least recently used on-demand image resizes until the cache fits its size cap"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-bytes', type=int, default=resize.CACHE_MAX_BYTES)
+
+    def handle(self, *args, **options):
+        deleted, freed = resize.sweep(options['max_bytes'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} file(s), freed {freed} bytes"))
@@ -5,6 +5,7 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = 'Categories'
@@ -0,0 +1,154 @@
+"""
+On-demand resizing of media images with a content-addressed disk cache.
+
+``/media/resize/<w>x<h>/<path>`` fits the image at ``path`` into a w x h box
+(never upscaling). Each result is stored once under
+``MEDIA_ROOT/resize-cache/`` named by a hash of the source path, its mtime
+and size, and the resize parameters. Re-uploading an image therefore yields
+a new name, and the hash doubles as a strong ETag. Files are served by
+nginx through X-Accel-Redirect when ``IMAGE_RESIZE_ACCEL_REDIRECT`` is set,
+and streamed with ``FileResponse`` otherwise.
+
+The cache is capped at ``IMAGE_RESIZE_CACHE_MAX_BYTES``. Hits refresh a
+file's mtime, and the sweeper deletes the least recently used files once
+the cap is exceeded.
+"""
+import hashlib
+import io
+import logging
+import os
+import random
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+CACHE_ROOT = getattr(settings, 'IMAGE_RESIZE_CACHE_ROOT', os.path.join(settings.MEDIA_ROOT, 'resize-cache'))
+CACHE_MAX_BYTES = getattr(settings, 'IMAGE_RESIZE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+MAX_DIMENSION = getattr(settings, 'IMAGE_RESIZE_MAX_DIMENSION', 2000)
+# Chance that writing a new file also sweeps the cache
+SWEEP_PROBABILITY = 0.01
+# Sweeping frees space down to this share of the cap
+SWEEP_TARGET = 0.9
+# Bump to invalidate every cached file after changing encoder settings
+VERSION = 1
+
+SOURCE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+
+class ResizeError(Exception):
+    pass
+
+
+def source_path(name):
+    """
+    Absolute path of a media file, refusing anything outside MEDIA_ROOT
+    """
+    root = os.path.realpath(settings.MEDIA_ROOT)
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep) or os.path.splitext(path)[1].lower() not in SOURCE_EXTENSIONS:
+        raise ResizeError('Not a media image')
+    if path.startswith(os.path.realpath(CACHE_ROOT) + os.sep):
+        raise ResizeError('Not a media image')
+    return path
+
+
+def output_format(source, accepts_webp):
+    if accepts_webp:
+        return 'webp'
+    return 'png' if os.path.splitext(source)[1].lower() == '.png' else 'jpg'
+
+
+def cache_key(source, width, height, fmt):
+    stat = os.stat(source)
+    raw = f'{VERSION}:{source}:{stat.st_mtime_ns}:{stat.st_size}:{width}x{height}:{fmt}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cached_path(key, fmt):
+    return os.path.join(CACHE_ROOT, key[:2], f'{key}.{fmt}')
+
+
+def _render(source, width, height, fmt):
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if fmt == 'jpg':
+            image.convert('RGB').save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+        elif fmt == 'webp':
+            image.save(buffer, 'WEBP', quality=80, method=4)
+        else:
+            image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def resize(name, width, height, accepts_webp=False):
+    """
+    Return ``(path, key, fmt)`` of the cached resize of media file ``name``,
+    rendering it first on a miss
+    """
+    if not (0 < width <= MAX_DIMENSION and 0 < height <= MAX_DIMENSION):
+        raise ResizeError('Unsupported size')
+    source = source_path(name)
+    if not os.path.isfile(source):
+        raise FileNotFoundError(name)
+
+    fmt = output_format(source, accepts_webp)
+    key = cache_key(source, width, height, fmt)
+    path = cached_path(key, fmt)
+    try:
+        # Touch on hit so the sweeper keeps recently used files
+        os.utime(path)
+        return path, key, fmt
+    except FileNotFoundError:
+        pass
+
+    data = _render(source, width, height, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write under a temporary name so concurrent requests never see a partial file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as output:
+        output.write(data)
+    os.replace(temp_path, path)
+
+    if random.random() < SWEEP_PROBABILITY:
+        sweep()
+    return path, key, fmt
+
+
+def sweep(max_bytes=CACHE_MAX_BYTES):
+    """
+    Delete least recently used files until the cache fits in ``max_bytes``.
+    Returns ``(files_deleted, bytes_freed)``.
+    """
+    entries = []
+    total = 0
+    for directory, _, files in os.walk(CACHE_ROOT):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return 0, 0
+
+    target = max_bytes * SWEEP_TARGET
+    deleted = freed = 0
+    for _, size, path in sorted(entries):
+        if total - freed <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        deleted += 1
+        freed += size
+    logger.info(f"Swept {deleted} resized image(s), {freed} bytes")
+    return deleted, freed
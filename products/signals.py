@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from . import catalog, images
+from .models import Category, Product
+
+
+@receiver(post_init, sender=Product)
+def remember_image(sender, instance, **kwargs):
+    # Keep the loaded image name so saves can tell when a new one is uploaded,
+    # and the category and slug so moving or renaming a product invalidates
+    # both the old and the new ones
+    instance._loaded_image_name = instance.image.name
+    instance._loaded_category_id = instance.category_id
+    instance._loaded_slug = instance.slug
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    category_ids = {instance._loaded_category_id, instance.category_id} - {None}
+    slugs = {instance._loaded_slug, instance.slug} - {''}
+    instance._loaded_category_id = instance.category_id
+    instance._loaded_slug = instance.slug
+    transaction.on_commit(lambda: catalog.invalidate(category_ids, slugs))
+
+    previous = instance._loaded_image_name
+    current = instance.image.name
+    instance._loaded_image_name = current
+    if current == previous:
+        return
+    if previous:
+        transaction.on_commit(lambda: images.delete_derivatives(previous))
+    if current:
+        transaction.on_commit(lambda: images.enqueue(current))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: catalog.invalidate([instance.category_id], [instance.slug]))
+    if instance._loaded_image_name:
+        transaction.on_commit(lambda: images.delete_derivatives(instance._loaded_image_name))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: catalog.invalidate([instance.pk], categories=True))
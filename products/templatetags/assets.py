@@ -0,0 +1,37 @@
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.utils.safestring import mark_safe
+
+from ecommerce import assets
+
+register = template.Library()
+
+
+def _read_critical_css():
+    path = finders.find(assets.CRITICAL_OUTPUT)
+    if path is None:
+        return ''
+    with open(path, encoding='utf-8') as handle:
+        return handle.read().strip()
+
+
+_cached_critical_css = lru_cache(maxsize=1)(_read_critical_css)
+
+
+@register.simple_tag
+def critical_css():
+    """
+    Inline the above-the-fold rules built by ``build_assets`` so the page
+    shell renders before the full stylesheet arrives
+
+        {% critical_css %}
+    """
+    css = _read_critical_css() if settings.DEBUG else _cached_critical_css()
+    if not css:
+        return ''
+    # Generated from our own stylesheets; only guard against closing the tag
+    css = css.replace('</', '<\\/')
+    return mark_safe(f'<style>{css}</style>')
@@ -0,0 +1,54 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from products import images
+
+register = template.Library()
+
+
+def _srcset(name, fmt, widths):
+    return ', '.join(
+        f'{default_storage.url(images.derivative_name(name, width, fmt))} {width}w'
+        for width in widths
+    )
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes='100vw', **attrs):
+    """
+    Render ``image`` as a <picture> with AVIF/WebP sources and a srcset
+    fallback built from its pregenerated derivatives. Images whose
+    derivatives are not ready yet are served as the original.
+
+        {% responsive_image product.image alt=product.name sizes="200px" class="card-img-top" %}
+    """
+    if not image:
+        return ''
+    manifest = images.derivatives(image.name)
+    attrs.setdefault('loading', 'lazy')
+    extra = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+
+    fallback = next((fmt for fmt in ('jpg', 'png') if fmt in manifest), None)
+    if fallback is None:
+        return format_html('<img src="{}" alt="{}" {}>', image.url, alt, extra)
+
+    sources = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (images.FORMATS[fmt][1], _srcset(image.name, fmt, manifest[fmt]), sizes)
+            for fmt in ('avif', 'webp') if fmt in manifest
+        )
+    )
+    # Browsers without srcset support get the largest derivative
+    srcset = _srcset(image.name, fallback, manifest[fallback])
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" {}></picture>',
+        sources,
+        default_storage.url(images.derivative_name(image.name, manifest[fallback][-1], fallback)),
+        srcset,
+        sizes,
+        alt,
+        extra
+    )
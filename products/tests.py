@@ -1,3 +1,116 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import redis
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from cart.models import Cart, CartItem
+
+from . import images
+from .management.commands import process_image_queue
+from .models import Category, Product
+
+LOCAL_CACHE = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+
+@override_settings(
+    CACHES={'default': LOCAL_CACHE, 'redis': LOCAL_CACHE, 'sessions': LOCAL_CACHE},
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+)
+class ProductDetailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Books', slug='books')
+        cls.product = Product.objects.create(category=category, name='Dune', slug='dune', price='9.99')
+
+    def get(self, **headers):
+        return self.client.get(self.product.get_absolute_url(), headers=headers)
+
+    def revalidate(self):
+        # The first response sets the CSRF cookie the ETag depends on
+        self.get()
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_product_page(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Dune')
+
+    def test_unknown_product_is_not_found(self):
+        response = self.client.get(reverse('product_detail', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_unchanged_page_is_not_modified(self):
+        etag = self.revalidate()
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+
+    def test_cart_change_invalidates_signed_in_page(self):
+        user = User.objects.create_user('reader')
+        self.client.force_login(user)
+        etag = self.revalidate()
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.create(cart=Cart.objects.create(user=user), product=self.product)
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ImageQueueTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(images, '_queue_client', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_worker_connection_outlasts_blocking_pop(self):
+        cache_client = redis.Redis(host='redis.internal', db=1, socket_timeout=1)
+        with mock.patch('django_redis.get_redis_connection', return_value=cache_client):
+            client = images._queue_connection()
+        kwargs = client.connection_pool.connection_kwargs
+        self.assertGreater(kwargs['socket_timeout'], images.QUEUE_WAIT)
+        self.assertEqual((kwargs['host'], kwargs['db']), ('redis.internal', 1))
+
+    def run_worker(self, outcomes):
+        """
+        Run the worker with ``dequeue`` raising each exception in
+        ``outcomes`` and finding the queue empty for anything else, stopping
+        once they run out. Returns the pauses between attempts.
+        """
+        outcomes = iter(outcomes)
+        stopping = mock.Mock()
+        stopping.is_set.side_effect = lambda: stopping.stop
+
+        def dequeue():
+            outcome = next(outcomes, None)
+            if outcome is None:
+                stopping.stop = True
+            elif isinstance(outcome, Exception):
+                raise outcome
+            return None
+
+        stopping.stop = False
+        with (
+            mock.patch.object(images, 'dequeue', dequeue),
+            mock.patch.object(process_image_queue, 'Event', return_value=stopping),
+            mock.patch.object(process_image_queue.signal, 'signal'),
+            self.assertLogs(process_image_queue.logger, 'WARNING'),
+        ):
+            call_command('process_image_queue', stdout=mock.Mock())
+        return [call.args[0] for call in stopping.wait.call_args_list]
+
+    def test_worker_backs_off_while_queue_is_unreachable(self):
+        pauses = self.run_worker([redis.ConnectionError('down')] * 8)
+        self.assertEqual(pauses, [1, 2, 4, 8, 16, 32, 60, 60])
+
+    def test_worker_backoff_resets_after_success(self):
+        down = redis.ConnectionError('down')
+        pauses = self.run_worker([down, down, 'empty', down])
+        self.assertEqual(pauses, [1, 2, 1])
@@ -6,4 +6,5 @@ urlpatterns = [
     path('products/', views.product_list, name='product_list'),
     path('category/<slug:category_slug>/', views.product_list, name='category_detail'),
     path('product/<slug:product_slug>/', views.product_detail, name='product_detail'),
+    path('page-fragments/', views.page_fragments, name='page_fragments'),
 ] 
\ No newline at end of file
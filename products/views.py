@@ -1,15 +1,26 @@
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.views.decorators.cache import never_cache
+from django.utils.http import parse_etags
+from PIL import UnidentifiedImageError
+from django.db.models import Q, Sum
 from .models import Category, Product
+from cart.models import CartItem
 from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
 from django.core.cache import cache
 from django.conf import settings
 import hashlib
+from . import resize
+from .catalog import catalog_scope, category_list, category_scope, conditional_page, product_scope
+from ecommerce.db.routers import replica_reads
 
+@conditional_page(catalog_scope)
+@replica_reads
 def home(request):
-    categories = Category.objects.all()
+    categories = category_list()
     featured_products = Product.objects.filter(available=True)[:8]
     
     context = {
@@ -29,10 +40,11 @@ def make_cache_key(request, *args, **kwargs):
 # Cache time in seconds
 CACHE_TTL = getattr(settings, 'CACHE_TIMEOUT', 900)  # 15 minutes default
 
-@cache_page(CACHE_TTL)
+@conditional_page(category_scope, csrf=True)
+@replica_reads
 def product_list(request, category_slug=None):
     category = None
-    categories = Category.objects.all()
+    categories = category_list()
     products = Product.objects.filter(available=True)
     
     if category_slug:
@@ -57,19 +69,24 @@ def product_list(request, category_slug=None):
         'search_query': search_query
     })
 
-def product_detail(request, id, slug):
+@conditional_page(product_scope, csrf=True)
+@replica_reads
+def product_detail(request, product_slug):
+    # Cached copies are keyed by the catalog version, so edits show up at once
+    version = getattr(request, 'catalog_version', '')
+    
     # Try to get product from cache first
-    cache_key = f'product:{id}:{slug}'
+    cache_key = f'product:{product_slug}:{version}'
     product = cache.get(cache_key)
     
     if not product:
         # If not in cache, fetch from database
-        product = get_object_or_404(Product, id=id, slug=slug, available=True)
+        product = get_object_or_404(Product, slug=product_slug, available=True)
         # Store in cache for future requests
         cache.set(cache_key, product, CACHE_TTL)
     
     # Get related products from the same category (cached)
-    related_key = f'related_products:{product.category.id}:{product.id}'
+    related_key = f'related_products:{product.category.id}:{product.id}:{version}'
     related_products = cache.get(related_key)
     
     if not related_products:
@@ -83,3 +100,48 @@ def product_detail(request, id, slug):
         'product': product,
         'related_products': related_products
     })
+
+def resize_image(request, width, height, path):
+    """
+    Serve ``path`` from the media tree resized to fit width x height
+    """
+    accepts_webp = 'image/webp' in request.headers.get('Accept', '')
+    try:
+        cached_path, key, fmt = resize.resize(path, width, height, accepts_webp)
+    except (resize.ResizeError, FileNotFoundError, UnidentifiedImageError):
+        raise Http404('Image not found')
+    
+    etag = f'"{key}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    elif getattr(settings, 'IMAGE_RESIZE_ACCEL_REDIRECT', ''):
+        # Let nginx send the file from its internal location
+        response = HttpResponse(content_type=resize.CONTENT_TYPES[fmt])
+        response['X-Accel-Redirect'] = f'{settings.IMAGE_RESIZE_ACCEL_REDIRECT}{key[:2]}/{key}.{fmt}'
+    else:
+        response = FileResponse(open(cached_path, 'rb'), content_type=resize.CONTENT_TYPES[fmt])
+    
+    # The URL of a given source and size only ever maps to this content
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['Vary'] = 'Accept'
+    return response
+
+@never_cache
+def page_fragments(request):
+    """
+    The per-visitor parts of pages served from the shared page cache
+    """
+    cart_items = 0
+    if request.user.is_authenticated:
+        cart_items = CartItem.objects.filter(cart__user=request.user).aggregate(total=Sum('quantity'))['total'] or 0
+    context = {'cart_items': cart_items}
+    fragments = {
+        name: render_to_string(f'partials/{name}.html', context, request)
+        for name in ('user_nav', 'messages', 'chat_button')
+    }
+    return JsonResponse({
+        'authenticated': request.user.is_authenticated,
+        'csrf_token': get_token(request),
+        'fragments': fragments,
+    })
@@ -1,13 +1,43 @@
-// Wait for the DOM to be fully loaded
-document.addEventListener('DOMContentLoaded', function() {
-    // Auto-hide alerts after 5 seconds
-    const alerts = document.querySelectorAll('.alert');
+// Auto-hide alerts after 5 seconds
+function autoHideAlerts(root) {
+    const alerts = root.querySelectorAll('.alert');
     alerts.forEach(function(alert) {
         setTimeout(function() {
             const bsAlert = new bootstrap.Alert(alert);
             bsAlert.close();
         }, 5000);
     });
+}
+
+// Pages served from the shared page cache are rendered for an anonymous
+// visitor; fetch this visitor's navbar, messages, chat button and CSRF token
+function loadPageFragments() {
+    const url = document.body.dataset.fragmentsUrl;
+    if (!url) {
+        return;
+    }
+    fetch(url, { credentials: 'same-origin' })
+        .then(response => response.json())
+        .then(data => {
+            document.querySelectorAll('[data-fragment]').forEach(function(element) {
+                const html = data.fragments[element.dataset.fragment];
+                if (html !== undefined) {
+                    element.innerHTML = html;
+                }
+            });
+            document.querySelectorAll('input[name="csrfmiddlewaretoken"]').forEach(function(input) {
+                input.value = data.csrf_token;
+            });
+            autoHideAlerts(document.querySelector('[data-fragment="messages"]'));
+            document.dispatchEvent(new CustomEvent('page:fragments', { detail: data }));
+        })
+        .catch(error => console.error('Error loading page fragments:', error));
+}
+
+// Wait for the DOM to be fully loaded
+document.addEventListener('DOMContentLoaded', function() {
+    autoHideAlerts(document);
+    loadPageFragments();
 
     // Quantity increment/decrement buttons for product detail page
     const quantityInput = document.querySelector('.quantity-input');